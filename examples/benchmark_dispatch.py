@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+Measures a service call of the WrapperSudsClient through a stub transport,
+which returns a canned Read reply, for the call through the __getattr__
+before the dispatch table and for the dispatch table. Usage:
+
+    python benchmark_dispatch.py [number]
+"""
+import os
+import sys
+import timeit
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from suds.transport import Reply
+from suds.transport.http import HttpTransport
+
+from lather import client
+
+log = client.log
+
+MOCKS = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..',
+                     'tests', 'mocks')
+NUMBER = 2000
+REPEAT = 5
+
+
+class StubTransport(HttpTransport):
+    """
+    Reads the WSDL from the file and replies the canned message to the
+    service calls, so only the client is measured
+    """
+
+    def __init__(self, message, **kwargs):
+        HttpTransport.__init__(self, **kwargs)
+        self.message = message
+
+    def send(self, request):
+        return Reply(200, {}, self.message)
+
+
+def read_reply():
+    with open(os.path.join(MOCKS, 'read.xml')) as f:
+        template = f.read()
+    # The mock is a template of the tests, the reply is the found customer
+    for tag in ('{% if result %}', '{% endif %}'):
+        template = template.replace(tag, '')
+    for name, value in (('element|default("Read_Result")', 'Read_Result'),
+                        ("key|default('Key')", 'Key'),
+                        ("no|default('TEST')", 'TEST'),
+                        ("name|default('Test')", 'Test')):
+        template = template.replace('{{ %s }}' % name, value)
+    return template
+
+
+def legacy_call(wrapper, item, *args, **kwargs):
+    """
+    The call through the __getattr__ before the dispatch table, which
+    formatted the debug messages even when they weren't logged
+    """
+    log.debug('[%s] Calling wrapper __getattr__: %s' % (log.name.upper(),
+                                                        item))
+    if hasattr(wrapper.client.service, item):
+        def wrapper_func(*args, **kwargs):
+            log.debug('[%s] called with %r and %r' % (log.name.upper(),
+                                                      args, kwargs))
+            func = getattr(wrapper.client.service, item)
+            return func(*args, **kwargs)
+
+        return wrapper_func(*args, **kwargs)
+    raise AttributeError(item)
+
+
+def main():
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else NUMBER
+    url = 'file://%s' % os.path.join(MOCKS, 'customer.xml')
+    wrapper = client.WrapperSudsClient(
+        url, cache=None, transport=StubTransport(read_reply()))
+    assert wrapper.Read(No='TEST').No == 'TEST'
+
+    results = [
+        ('legacy __getattr__', lambda: legacy_call(wrapper, 'Read',
+                                                   No='TEST')),
+        ('dispatch table', lambda: wrapper.Read(No='TEST')),
+    ]
+    # The best of the repeats, which are alternated between the calls
+    best = dict((name, None) for name, func in results)
+    for count in range(REPEAT):
+        for name, func in results:
+            seconds = timeit.timeit(func, number=number)
+            if best[name] is None or seconds < best[name]:
+                best[name] = seconds
+    for name, func in results:
+        seconds = best[name]
+        print '%-20s %8.2f us per call' % (name, seconds / number * 1e6)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,339 @@
+# -*- coding: utf-8 -*-
+import os
+import time
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+import suds
+from suds.cache import Cache
+
+log = logging.getLogger('lather_client')
+
+# Sentinel which means "use the default timeout of the cache"
+DEFAULT_TIMEOUT = object()
+_MISSING = object()
+
+
+class Record(object):
+    """
+    Picklable copy of a suds object, with the same attributes and keylist
+    """
+
+    def __init__(self, obj):
+        self.__keylist__ = list(obj.__keylist__)
+        for attr in self.__keylist__:
+            setattr(self, attr, to_records(getattr(obj, attr)))
+
+    def __repr__(self):
+        return '<Record: %s>' % ', '.join(
+            ['%s=%r' % (attr, getattr(self, attr))
+             for attr in self.__keylist__])
+
+
+def to_records(value):
+    """
+    Converts the suds objects of the value (which can be a list or tuple
+    of them) to records
+    """
+    if isinstance(value, (list, tuple)):
+        return type(value)([to_records(v) for v in value])
+    if hasattr(value, '__keylist__'):
+        return Record(value)
+    return value
+
+
+class BaseCache(object):
+    """
+    Interface of the cache backends. The keys are tuples or strings and the
+    backends which store the values out of the process pickle them. Every
+    backend counts its hits, misses and evictions at the stats
+    """
+    # The backends which store the values out of the process can't store
+    # the suds objects, which are converted to records
+    in_process = False
+
+    def __init__(self, max_entries=128, timeout=None):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self.stats = dict(hits=0, misses=0, evictions=0)
+        self._stats_lock = threading.Lock()
+
+    def _count(self, stat, value=1):
+        with self._stats_lock:
+            self.stats[stat] += value
+
+    def _get_expiration(self, timeout):
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.timeout
+        if timeout is None:
+            return None
+        return time.time() + timeout
+
+    def make_key(self, key):
+        """
+        Return a string for the key, for the backends which need it
+        """
+        return hashlib.md5(repr(key)).hexdigest()
+
+    def get(self, key, default=None):
+        raise NotImplementedError
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def get_or_set(self, key, func, timeout=DEFAULT_TIMEOUT):
+        """
+        Return the value of the key, or call the func and cache its result
+        """
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = func()
+            self.set(key, value, timeout)
+        return value
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+
+class LRUCache(BaseCache):
+    """
+    Thread safe in-memory cache with least recently used eviction and an
+    optional timeout (in seconds) for every entry
+    """
+    in_process = True
+
+    def __init__(self, max_entries=128, timeout=None):
+        super(LRUCache, self).__init__(max_entries, timeout)
+        self._data = OrderedDict()
+        self._lock = threading.RLock()
+        self._key_locks = {}
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+    def __contains__(self, key):
+        return self._get(key, _MISSING) is not _MISSING
+
+    def _get(self, key, default=None):
+        with self._lock:
+            try:
+                expires, value = self._data.pop(key)
+            except KeyError:
+                return default
+
+            if expires is not None and expires <= time.time():
+                return default
+
+            self._data[key] = (expires, value)
+            return value
+
+    def get(self, key, default=None):
+        """
+        Return the value of the key and mark it as the most recently used,
+        or the default if the key doesn't exist or has expired
+        """
+        value = self._get(key, _MISSING)
+        if value is _MISSING:
+            self._count('misses')
+            return default
+
+        self._count('hits')
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT):
+        """
+        Add the value to the cache, evicting the least recently used
+        entries when the cache is full
+        """
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (self._get_expiration(timeout), value)
+            while self.max_entries and len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self._count('evictions')
+
+    def get_or_set(self, key, func, timeout=DEFAULT_TIMEOUT):
+        """
+        Return the value of the key, or call the func and cache its result.
+        Concurrent callers of the same missing key wait for a single call
+        of the func
+        """
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        try:
+            with key_lock:
+                value = self._get(key, _MISSING)
+                if value is _MISSING:
+                    value = func()
+                    self.set(key, value, timeout)
+        finally:
+            with self._lock:
+                self._key_locks.pop(key, None)
+
+        return value
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class FileBasedCache(BaseCache):
+    """
+    Cache which stores the pickled values at files of a directory, so the
+    processes of the same host (e.g. the workers of a server) share it. The
+    files are written atomically and, when the cache is full, the oldest
+    tenth of the entries is evicted
+    """
+
+    def __init__(self, location, max_entries=1000, timeout=None):
+        super(FileBasedCache, self).__init__(max_entries, timeout)
+        self.location = location
+
+    def _get_filename(self, key):
+        return os.path.join(self.location, '%s.cache' % self.make_key(key))
+
+    def _list(self):
+        try:
+            return [os.path.join(self.location, f) for f in
+                    os.listdir(self.location) if f.endswith('.cache')]
+        except OSError:
+            return []
+
+    def get(self, key, default=None):
+        filename = self._get_filename(key)
+        try:
+            with open(filename, 'rb') as f:
+                expires, value = pickle.load(f)
+        except IOError:
+            self._count('misses')
+            return default
+        except Exception, e:
+            log.warning('[%s] Failed to load the cached file %s: %s'
+                        % (log.name.upper(), filename, e))
+            self._count('misses')
+            return default
+
+        if expires is not None and expires <= time.time():
+            self._remove(filename)
+            self._count('misses')
+            return default
+
+        self._count('hits')
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT):
+        try:
+            if not os.path.isdir(self.location):
+                os.makedirs(self.location)
+        except OSError:
+            # Another process created the directory
+            pass
+
+        try:
+            fd, tmp = tempfile.mkstemp(dir=self.location, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump((self._get_expiration(timeout), value), f,
+                            pickle.HIGHEST_PROTOCOL)
+            os.rename(tmp, self._get_filename(key))
+        except Exception, e:
+            log.warning('[%s] Failed to cache the key %r: %s'
+                        % (log.name.upper(), key, e))
+            return
+
+        self._cull()
+
+    def _remove(self, filename):
+        try:
+            os.remove(filename)
+            return True
+        except OSError:
+            return False
+
+    def _cull(self):
+        if not self.max_entries:
+            return
+
+        filenames = self._list()
+        if len(filenames) <= self.max_entries:
+            return
+
+        def mtime(filename):
+            try:
+                return os.path.getmtime(filename)
+            except OSError:
+                return 0
+
+        count = len(filenames) - self.max_entries + self.max_entries / 10
+        for filename in sorted(filenames, key=mtime)[:count]:
+            if self._remove(filename):
+                self._count('evictions')
+
+    def delete(self, key):
+        self._remove(self._get_filename(key))
+
+    def clear(self):
+        for filename in self._list():
+            self._remove(filename)
+
+
+class WsdlCache(Cache):
+    """
+    Suds cache which stores the parsed (pickled) WSDL definitions at a cache
+    backend, by default files of the location directory. The keys contain
+    the cache format, the suds version and the fingerprint (ETag or hash) of
+    the WSDL, so a changed WSDL is never served from the cache.
+    """
+    version = 1
+
+    def __init__(self, location, fingerprint):
+        if isinstance(location, BaseCache):
+            self.backend = location
+        else:
+            location = os.path.join(
+                location, 'v%s-suds-%s' % (self.version, suds.__version__))
+            self.backend = FileBasedCache(location, max_entries=None)
+        self.fingerprint = fingerprint
+
+    def __deepcopy__(self, memo):
+        # The clones of the suds client share the backend
+        return self
+
+    def _make_key(self, id):
+        return ('wsdl', self.version, suds.__version__, id, self.fingerprint)
+
+    def get(self, id):
+        return self.backend.get(self._make_key(id))
+
+    def put(self, id, object):
+        self.backend.set(self._make_key(id), object, timeout=None)
+        return object
+
+    def purge(self, id):
+        self.backend.delete(self._make_key(id))
+
+    def clear(self):
+        self.backend.clear()
@@ -1,23 +1,108 @@
 # -*- coding: utf-8 -*-
+import copy
+import time
+import hashlib
+import threading
 import logging
 import urlparse
 import urllib
 import urllib2
+from multiprocessing.pool import ThreadPool
 
 from suds.client import Client
+from suds.sudsobject import Object
+from suds.bindings.multiref import MultiRef
 from suds.transport.https import HttpAuthenticated
 from suds.plugin import DocumentPlugin
+from suds.transport import Request
 from suds.transport import TransportError
 
+from .cache import LRUCache
+from .cache import WsdlCache
 from .enums import AuthEnums
+from .https import ConnectionPool
+from .utils import SingleFlight
 from .https import NTLMSSPAuthenticated
+from .https import PooledNTLMAuthenticated
+from .https import PooledHttpTransport
+from .https import PooledHttpAuthenticated
 from .decorators import require_client
 from .exceptions import ConnectionError
 from .exceptions import InvalidBaseUrlException
+from .utils import map_concurrently
 
 log = logging.getLogger('lather_client')
 
 
+class ReplyMultiRef(MultiRef):
+    """
+    Suds keeps the state of the multiref processing at the binding, which
+    the clones of a client share, so every reply is processed by a new
+    MultiRef and the clones can receive replies concurrently
+    """
+
+    def process(self, body):
+        return MultiRef().process(body)
+
+
+class ServiceIndex(object):
+    """
+    Metadata of the methods of a WSDL, built once and shared by the clones
+    of the client: the parameters of the methods and templates of the
+    objects of the types, which are copied instead of being created by the
+    suds factory at every call
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.params = {}
+        for service in client.wsdl.services:
+            for port in service.ports:
+                for name, method in port.methods.items():
+                    self.params.setdefault(
+                        name, method.binding.input.param_defs(method))
+        self.param_names = dict(
+            (name, [str(p[0]) for p in params])
+            for name, params in self.params.items())
+        self._templates = {}
+        self._lock = threading.Lock()
+
+    def get_params(self, method):
+        return self.params.get(method, [])
+
+    def get_param_names(self, method):
+        return self.param_names.get(method, [])
+
+    def create(self, name):
+        """
+        Return a new object of the type
+        """
+        template = self._templates.get(name)
+        if template is None:
+            with self._lock:
+                template = self._templates.get(name)
+                if template is None:
+                    template = self.client.factory.create(name)
+                    self._templates[name] = template
+        return self._copy(template)
+
+    def _copy(self, value):
+        """
+        Copies the suds object. The metadata, which references the schema,
+        is shared by the copies
+        """
+        if isinstance(value, list):
+            return [self._copy(v) for v in value]
+        if not isinstance(value, Object):
+            return value
+
+        obj = copy.copy(value)
+        obj.__dict__['__keylist__'] = value.__keylist__[:]
+        for key in value.__keylist__:
+            obj.__dict__[key] = self._copy(value.__dict__[key])
+        return obj
+
+
 class WrapperSudsClient(object):
     def __init__(self, endpoint, **kwargs):
         """
@@ -25,6 +110,7 @@ class WrapperSudsClient(object):
         """
         log.debug('[%s] Calling wrapper __init__: %s' % (log.name.upper(),
                                                          endpoint))
+        self.endpoint = endpoint
         self.client = None
         try:
             self.client = Client(endpoint, **kwargs)
@@ -38,29 +124,73 @@ class WrapperSudsClient(object):
                       'this error: %s' % (log.name.upper(), endpoint, e))
             raise ConnectionError('Connection error: %s' % e)
 
+        for service in self.client.wsdl.services:
+            for port in service.ports:
+                for method in port.methods.values():
+                    method.binding.input.multiref = ReplyMultiRef()
+                    method.binding.output.multiref = ReplyMultiRef()
+        self.index = ServiceIndex(self.client)
+        self._bind_methods()
+
     def __getattr__(self, item):
         """
-        Handles suds service calls
+        Handles suds service calls whose names are attributes of the wrapper
         """
-        log.debug('[%s] Calling wrapper __getattr__: %s' % (log.name.upper(),
-                                                            item))
-        if hasattr(self.client.service, item):
-            def wrapper(*args, **kwargs):
-                log.debug('[%s] called with %r and %r' % (log.name.upper(),
-                                                          args, kwargs))
-                func = getattr(self.client.service, item)
-                return func(*args, **kwargs)
-
-            return wrapper
+        methods = self.__dict__.get('methods')
+        if methods is not None and item in methods:
+            return methods[item]
         raise AttributeError(item)
 
+    def _make_method(self, name):
+        func = getattr(self.client.service, name)
+
+        def method(*args, **kwargs):
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug('[%s] %s called with %r and %r'
+                          % (log.name.upper(), name, args, kwargs))
+            return func(*args, **kwargs)
+
+        method.__name__ = str(name)
+        return method
+
+    def _bind_methods(self):
+        """
+        Builds the dispatch table of the service calls. The calls are also
+        set as attributes of the wrapper, unless their names conflict with
+        the attributes of the wrapper (e.g. client), so they are found
+        without the __getattr__. The conflicting calls are at the methods
+        """
+        methods = {}
+        for name in self.index.params:
+            method = self._make_method(name)
+            methods[name] = method
+            if not hasattr(self.__class__, name) and \
+                    name not in self.__dict__ and name != 'methods':
+                self.__dict__[name] = method
+        self.methods = methods
+
+    @require_client
+    def clone(self, location):
+        """
+        Returns a new wrapper which shares the parsed WSDL with this one but
+        sends the service calls to another location
+        """
+        log.debug('[%s] Clone wrapper for %s' % (log.name.upper(), location))
+        clone = self.__class__.__new__(self.__class__)
+        clone.endpoint = location
+        clone.client = self.client.clone()
+        clone.client.set_options(location=location)
+        clone.index = self.index
+        clone._bind_methods()
+        return clone
+
     @require_client
     def factory(self, name):
         """
         Returns the structure of the suds model
         """
         log.debug('[%s] Create factory for %s' % (log.name.upper(), name))
-        return self.client.factory.create(name)
+        return self.index.create(name)
 
     @require_client
     def get_services(self):
@@ -76,19 +206,15 @@ class WrapperSudsClient(object):
         Get params of the service
         :return: list of tuples, [(name, element),...]
         """
-        params = []
-        try:
-            method = self.client.wsdl.services[0].ports[0].methods[service]
-            params = method.binding.input.param_defs(method)
-        except KeyError:
-            pass
-
-        return params
+        return self.index.get_params(service)
 
 
 class LatherClient(object):
     def __init__(self, base, username=None, password=None, auth=None,
-                 proxy=None, **kwargs):
+                 proxy=None, client_cache_size=128, client_cache_timeout=3600,
+                 wsdl_cache_dir=None, wsdl_cache=None, pool_connections=False,
+                 pool_size=10, pool_idle_timeout=60, coalesce_reads=True,
+                 **kwargs):
         self.base = base
         self.username = username
         self.password = password
@@ -96,6 +222,23 @@ class LatherClient(object):
         self.proxy = proxy
         self.models = []
         self.options = kwargs
+        # Parsed suds clients, keyed by the endpoint and the options
+        self.clients = LRUCache(max_entries=client_cache_size,
+                                timeout=client_cache_timeout)
+        # Changes at every invalidation, so the holders of the connections
+        # (e.g. the managers) reconnect
+        self.generation = 0
+        # Directory of the parsed WSDL definitions, shared between processes
+        self.wsdl_cache_dir = wsdl_cache_dir
+        # Or a cache backend of the parsed WSDL definitions
+        self.wsdl_cache = wsdl_cache
+        # Concurrent identical reads share one request
+        self.single_flight = SingleFlight() if coalesce_reads else None
+        # Keep-alive connections shared by the transports of this client
+        self.pool = None
+        if pool_connections:
+            self.pool = ConnectionPool(pool_size=pool_size,
+                                       idle_timeout=pool_idle_timeout)
         if self.username and self.password and not self.auth:
             self.auth = AuthEnums.NTLM
 
@@ -103,6 +246,11 @@ class LatherClient(object):
         """
         Create the NTLM auth
         """
+        if self.pool:
+            return PooledNTLMAuthenticated(pool=self.pool,
+                                           username=self.username,
+                                           password=self.password)
+
         ntlm = NTLMSSPAuthenticated(username=self.username,
                                     password=self.password)
         return ntlm
@@ -111,6 +259,11 @@ class LatherClient(object):
         """
         Create the Basic auth
         """
+        if self.pool:
+            return PooledHttpAuthenticated(pool=self.pool,
+                                           username=self.username,
+                                           password=self.password)
+
         basic = HttpAuthenticated(username=self.username,
                                   password=self.password)
         return basic
@@ -122,9 +275,10 @@ class LatherClient(object):
         options = dict()
         if self.auth == AuthEnums.NTLM and self.username and self.password:
             options.update(transport=self._create_ntlm_auth())
-
-        if self.auth == AuthEnums.BASIC and self.username and self.password:
+        elif self.auth == AuthEnums.BASIC and self.username and self.password:
             options.update(transport=self._create_basic_auth())
+        elif self.pool:
+            options.update(transport=PooledHttpTransport(pool=self.pool))
 
         if self.proxy:
             options.update(proxy=self.proxy)
@@ -134,6 +288,62 @@ class LatherClient(object):
 
         return options
 
+    def _make_wsdl_options(self, endpoint):
+        """
+        Creates the options for loading the WSDL of the endpoint. If the
+        wsdl_cache_dir or the wsdl_cache backend is set, the parsed WSDL is
+        loaded from the cache when its fingerprint has not changed
+        """
+        options = self._make_options()
+        # An empty cache backend is false, so it's compared with None
+        location = self.wsdl_cache
+        if location is None:
+            location = self.wsdl_cache_dir
+        if not location and location is not self.wsdl_cache:
+            return options
+
+        try:
+            fingerprint = self._get_wsdl_fingerprint(endpoint, options)
+        except (TransportError, urllib2.URLError, ValueError, IOError), e:
+            log.warning('[%s] Failed to get the fingerprint of %s, the WSDL '
+                        'cache will not be used: %s' % (log.name.upper(),
+                                                        endpoint, e))
+            return options
+
+        options.update(cache=WsdlCache(location, fingerprint),
+                       cachingpolicy=1)
+        return options
+
+    def _get_wsdl_fingerprint(self, endpoint, options):
+        """
+        Returns the ETag of the WSDL or the hash of its content if the
+        server doesn't send an ETag
+        """
+        transport = options.get('transport') or HttpAuthenticated()
+        if self.proxy:
+            transport.options.proxy = self.proxy
+
+        fp = transport.open(Request(endpoint))
+        try:
+            etag = None
+            if hasattr(fp, 'info'):
+                etag = fp.info().getheader('ETag')
+            if etag:
+                return hashlib.sha1('%s:%s' % (endpoint, etag)).hexdigest()
+            return hashlib.sha1(fp.read()).hexdigest()
+        finally:
+            fp.close()
+
+    def _make_cache_key(self, endpoint):
+        """
+        Creates the key of the client cache. The transport objects are
+        created on every _make_options call, so use the attributes which
+        produce the options instead
+        """
+        proxy = sorted(self.proxy.items()) if self.proxy else None
+        return (endpoint, self.username, self.auth, repr(proxy),
+                repr(sorted(self.options.items())))
+
     def make_endpoint(self, page, **kwargs):
         """
         Creates the endpoint
@@ -142,13 +352,34 @@ class LatherClient(object):
 
     def connect(self, page, *args, **kwargs):
         """
-        Creates the connection to the endpoint
+        Creates the connection to the endpoint or returns the cached one,
+        so the WSDL is downloaded and parsed only once per endpoint
         """
         endpoint = self.make_endpoint(page, *args, **kwargs)
-        options = self._make_options()
+        key = self._make_cache_key(endpoint)
+        return self.clients.get_or_set(
+            key, lambda: self._create_client(page, endpoint))
 
+    def _create_client(self, page, endpoint):
+        """
+        Creates a new connection to the endpoint
+        """
+        options = self._make_wsdl_options(endpoint)
         return WrapperSudsClient(endpoint, **options)
 
+    def invalidate(self, page=None, *args, **kwargs):
+        """
+        Removes the cached connection of the page, or all the cached
+        connections if the page is not specified
+        """
+        self.generation += 1
+        if page is None:
+            self.clients.clear()
+            return
+
+        endpoint = self.make_endpoint(page, *args, **kwargs)
+        self.clients.delete(self._make_cache_key(endpoint))
+
     def register(self, model):
         """
         Registers a model to this client and passes the client to the model
@@ -157,21 +388,42 @@ class LatherClient(object):
         model.client = self
         model.objects = model._meta.manager(model)
 
+    def _get_warmup_targets(self):
+        """
+        Returns the (page, args) of the connections which the warmup loads
+        """
+        return [(model._meta.page, ()) for model in self.models]
+
+    def warmup(self, max_workers=4):
+        """
+        Loads the connections of all the registered models on a thread pool,
+        so the first requests don't pay the cost of the WSDL.
+        :return: list of tuples, [(endpoint, seconds, error),...]
+        """
+        def load(target):
+            page, args = target
+            endpoint = self.make_endpoint(page, *args)
+            error = None
+            start = time.time()
+            try:
+                self.connect(page, *args)
+            except (ConnectionError, InvalidBaseUrlException), e:
+                error = e
+            elapsed = time.time() - start
+            log.info('[%s] Warmup of %s took %.3fs%s'
+                     % (log.name.upper(), endpoint, elapsed,
+                        ' (failed: %s)' % error if error else ''))
+            return endpoint, elapsed, error
+
+        return map_concurrently(load, self._get_warmup_targets(), max_workers)
+
     # TODO: Duplicate, find a way to remove it
     def get_service_params(self, service, page):
         """
         Get params of the service
         :return: list of tuples, [(name, element),...]
         """
-        params = []
-        client = self.connect(page)
-        try:
-            method = client.client.wsdl.services[0].ports[0].methods[service]
-            params = method.binding.input.param_defs(method)
-        except KeyError:
-            pass
-
-        return params
+        return self.connect(page).get_service_params(service)
 
 
 class NavLatherClient(LatherClient):
@@ -179,36 +431,191 @@ class NavLatherClient(LatherClient):
         self.invalid_companies = kwargs.pop('invalid_companies', [])
         self.active = kwargs.pop('active', True)
         self.main = kwargs.pop('main', 'SystemService')
+        # Max number of companies which are queried concurrently, on the
+        # executor (e.g. a ThreadPool) or on a pool of max_workers threads
+        # which the client creates at the first use and reuses
+        self.max_workers = kwargs.pop('max_workers', 8)
+        self._executor = kwargs.pop('executor', None)
+        self._executor_lock = threading.Lock()
+        # The companies are refreshed in the background every
+        # companies_timeout seconds and, if the companies_cache backend is
+        # set, they are stored there and loaded from there after a restart
+        self.companies_timeout = kwargs.pop('companies_timeout', 3600)
+        self.companies_cache = kwargs.pop('companies_cache', None)
         super(NavLatherClient, self).__init__(*args, **kwargs)
-        self.companies = [None]
-        if self.active:
-            self.companies = []
-            try:
-                self.update_companies()
-            except:
-                pass
+        # Parsed service definitions, one per page, shared by the companies
+        self.definitions = LRUCache(max_entries=self.clients.max_entries,
+                                    timeout=self.clients.timeout)
+        # (companies, expires), the companies are loaded at the first use
+        self._companies = (None, None)
+        self._companies_lock = threading.Lock()
+        self._refreshing = False
+
+    @property
+    def executor(self):
+        """
+        The thread pool of the concurrent company queries
+        """
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPool(max(self.max_workers, 1))
+        return self._executor
+
+    @property
+    def companies(self):
+        """
+        The companies of the server, loaded at the first use. When they
+        expire, the old companies are returned until a background thread
+        refreshes them
+        """
+        if not self.active:
+            return [None]
+
+        companies, expires = self._companies
+        if companies is None:
+            with self._companies_lock:
+                companies, expires = self._companies
+                if companies is None:
+                    companies, expires = self._load_companies()
+
+        if expires is not None and expires <= time.time():
+            self._start_refresh()
+        return companies
+
+    @companies.setter
+    def companies(self, value):
+        self._set_companies(value, time.time())
+
+    def _set_companies(self, companies, timestamp):
+        expires = None
+        if self.companies_timeout is not None:
+            expires = timestamp + self.companies_timeout
+        self._companies = (companies, expires)
+        return self._companies
+
+    def _get_companies_cache_key(self):
+        return ('companies', self.base, self.main)
+
+    def _load_companies(self):
+        """
+        Loads the companies from the companies_cache or the server
+        """
+        if self.companies_cache is not None:
+            cached = self.companies_cache.get(self._get_companies_cache_key())
+            if cached is not None:
+                timestamp, companies = cached
+                return self._set_companies(companies, timestamp)
+
+        try:
+            self.update_companies()
+        except Exception, e:
+            log.error('[%s] Failed to get the companies from %s: %s'
+                      % (log.name.upper(), self.main, e))
+            raise
+        return self._companies
+
+    def _start_refresh(self):
+        with self._companies_lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        thread = threading.Thread(target=self._refresh_companies,
+                                  name='lather-companies')
+        thread.daemon = True
+        thread.start()
+
+    def _refresh_companies(self):
+        try:
+            self.update_companies()
+        except Exception, e:
+            # Keep the old companies and retry later
+            log.warning('[%s] Failed to refresh the companies from %s: %s'
+                        % (log.name.upper(), self.main, e))
+            companies, expires = self._companies
+            self._companies = (companies,
+                               time.time() + min(self.companies_timeout, 60))
+        finally:
+            self._refreshing = False
 
     def make_endpoint(self, page, company=None):
         """
         Creates the endpoint
         """
+        # The companies are loaded through the main endpoint, so it doesn't
+        # load them
+        if page == self.main:
+            companies = self._companies[0]
+        else:
+            companies = self.companies
         if company:
             url = '%s/%s' % (urllib.quote(company), page)
-        elif self.companies and self.companies[0]:
-            url = '%s/%s' % (urllib.quote(self.companies[0]), page)
+        elif companies and companies[0]:
+            url = '%s/%s' % (urllib.quote(companies[0]), page)
         else:
             url = page
 
         return urlparse.urljoin(self.base, url)
 
+    def _create_client(self, page, endpoint):
+        """
+        Creates a new connection to the endpoint from the shared service
+        definition of the page
+        """
+        return self.get_definition(page).clone(endpoint)
+
+    def get_definition(self, page):
+        """
+        Returns the parsed service definition of the page. Every company
+        serves the same WSDL and only the service location differs, so the
+        WSDL is parsed once per page and each company gets a clone with its
+        own location
+        """
+        def create_definition():
+            endpoint = self.make_endpoint(page)
+            options = self._make_wsdl_options(endpoint)
+            return WrapperSudsClient(endpoint, **options)
+
+        key = self._make_cache_key(page)
+        return self.definitions.get_or_set(key, create_definition)
+
+    def _get_warmup_targets(self):
+        """
+        Returns the (page, args) of the connections of every company
+        """
+        return [(model._meta.page, (company, )) for model in self.models
+                for company in self.companies]
+
+    def invalidate(self, page=None, company=None):
+        """
+        Removes the cached connection of the page for the company. If the
+        company is not specified, removes the service definition of the page
+        and the connections of all the companies
+        """
+        if page is None:
+            self.definitions.clear()
+        elif company is None:
+            self.definitions.delete(self._make_cache_key(page))
+            for name in self.companies:
+                super(NavLatherClient, self).invalidate(page, name)
+
+        super(NavLatherClient, self).invalidate(page, company)
+
     def update_companies(self):
         """
         Make an initial request to the system service endpoint to get all
         the companies
         """
         client = self.connect(self.main)
-        self.companies = list(
-            set(client.Companies()) - set(self.invalid_companies))
+        companies = [unicode(c) for c in
+                     set(client.Companies()) - set(self.invalid_companies)]
+        timestamp = time.time()
+        self._set_companies(companies, timestamp)
+        if self.companies_cache is not None:
+            self.companies_cache.set(self._get_companies_cache_key(),
+                                     (timestamp, companies), timeout=None)
+        return companies
 
 
 class AddService(DocumentPlugin):
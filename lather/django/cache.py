@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+import uuid
+
+from django.core.cache import caches
+
+from lather.cache import BaseCache, DEFAULT_TIMEOUT
+
+_missing = object()
+
+
+class DjangoCache(BaseCache):
+    """
+    Adapter of a cache of the Django cache framework, e.g. to share the
+    results between the workers through memcached or redis. The keys are
+    prefixed with the key_prefix and a version, which the clear changes, so
+    it doesn't remove the keys of the other users of the cache. Django
+    doesn't report the evictions, so the evictions of the stats stay 0
+    """
+
+    def __init__(self, alias='default', timeout=None, key_prefix='lather'):
+        super(DjangoCache, self).__init__(None, timeout)
+        self.alias = alias
+        self.key_prefix = key_prefix
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    @property
+    def version_key(self):
+        return '%s:version' % self.key_prefix
+
+    def get_version(self):
+        """
+        Return the version of the keys. It's stored at the cache, so the
+        processes which share the cache clear the keys of each other, and
+        it's random, so the old keys aren't read again if it's evicted
+        """
+        version = self.cache.get(self.version_key)
+        if version is None:
+            version = uuid.uuid4().hex
+            self.cache.add(self.version_key, version, None)
+            version = self.cache.get(self.version_key, version)
+        return version
+
+    def make_key(self, key):
+        return '%s:%s:%s' % (self.key_prefix, self.get_version(),
+                             super(DjangoCache, self).make_key(key))
+
+    def get(self, key, default=None):
+        value = self.cache.get(self.make_key(key), _missing)
+        if value is _missing:
+            self._count('misses')
+            return default
+
+        self._count('hits')
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT):
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.timeout
+        self.cache.set(self.make_key(key), value, timeout)
+
+    def delete(self, key):
+        self.cache.delete(self.make_key(key))
+
+    def clear(self):
+        """
+        Changes the version, so the old keys aren't read and the cache
+        evicts them or they expire
+        """
+        self.cache.set(self.version_key, uuid.uuid4().hex, None)
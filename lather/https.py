@@ -1,3 +1,16 @@
+import re
+import time
+import base64
+import socket
+import httplib
+import urllib
+import urllib2
+import urlparse
+import threading
+from StringIO import StringIO
+
+from suds.transport import Reply
+from suds.transport import TransportError
 from suds.transport.http import HttpTransport
 from suds.transport.https import WindowsHttpAuthenticated
 
@@ -19,4 +32,298 @@ class NTLMSSPAuthenticated(WindowsHttpAuthenticated):
         handlers.append(HTTPNtlmAuthHandler.HTTPNtlmAuthHandler(
             password_mgr=self.pm,header='Negotiate')
         )
-        return handlers
\ No newline at end of file
+        return handlers
+
+
+class StaleConnectionError(Exception):
+    """
+    The pooled connection failed before the request reached the server, so
+    the request can be sent again on another connection
+    """
+
+    def __init__(self, error):
+        Exception.__init__(self, error)
+        self.error = error
+
+
+class ConnectionPool(object):
+    """
+    Keeps the idle persistent http connections per host, so they can be
+    reused by the next requests.
+    @ivar pool_size: The max number of idle connections per host.
+    @ivar idle_timeout: The seconds after which an idle connection is closed.
+    @ivar stats: The number of created, reused and discarded connections.
+    """
+
+    def __init__(self, pool_size=10, idle_timeout=60):
+        self.pool_size = pool_size
+        self.idle_timeout = idle_timeout
+        self.stats = dict(created=0, reused=0, discarded=0)
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def _create(self, key, timeout, proxy=None):
+        scheme, host = key
+        connection_class = httplib.HTTPConnection
+        if scheme == 'https':
+            connection_class = httplib.HTTPSConnection
+
+        if proxy:
+            proxy_host = urlparse.urlsplit(proxy).netloc or proxy
+            connection = connection_class(proxy_host, timeout=timeout)
+            if scheme == 'https':
+                connection.set_tunnel(host)
+        else:
+            connection = connection_class(host, timeout=timeout)
+
+        return connection
+
+    def acquire(self, key, timeout, proxy=None):
+        """
+        Returns an idle connection to the host or a new one.
+        :return: tuple, (connection, reused)
+        """
+        now = time.time()
+        with self._lock:
+            idle = self._idle.get(key, [])
+            while idle:
+                connection, last_used = idle.pop()
+                if now - last_used < self.idle_timeout:
+                    self.stats['reused'] += 1
+                    return connection, True
+                self.stats['discarded'] += 1
+                connection.close()
+            self.stats['created'] += 1
+
+        return self._create(key, timeout, proxy), False
+
+    def release(self, key, connection):
+        """
+        Returns the connection to the pool or closes it if the pool is full
+        """
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.pool_size:
+                idle.append((connection, time.time()))
+                return
+            self.stats['discarded'] += 1
+        connection.close()
+
+    def discard(self, connection):
+        """
+        Closes a broken connection
+        """
+        with self._lock:
+            self.stats['discarded'] += 1
+        connection.close()
+
+    def clear(self):
+        """
+        Closes all the idle connections
+        """
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for connection, last_used in connections:
+                connection.close()
+
+
+class PooledHttpTransport(HttpTransport):
+    """
+    Http transport which keeps the connections alive and reuses them from
+    a connection pool, instead of opening a new connection (and TLS session)
+    for every request like the urllib2 based transports.
+    @ivar pool: The connection pool, can be shared between transports.
+    """
+
+    def __init__(self, pool=None, **kwargs):
+        HttpTransport.__init__(self, **kwargs)
+        self.pool = pool if pool is not None else ConnectionPool()
+
+    def open(self, request):
+        response, body = self._request('GET', request.url, None,
+                                       dict(request.headers))
+        if response.status >= 300:
+            raise TransportError(response.reason, response.status,
+                                 StringIO(body))
+
+        return urllib.addinfourl(StringIO(body), response.msg, request.url,
+                                 response.status)
+
+    def send(self, request):
+        headers = dict(self.options.headers)
+        headers.update(request.headers)
+        response, body = self._request('POST', request.url, request.message,
+                                       headers)
+        if response.status in (202, 204):
+            return None
+        if response.status >= 300:
+            raise TransportError(response.reason, response.status,
+                                 StringIO(body))
+
+        return Reply(200, dict(response.getheaders()), body)
+
+    def _get_proxy(self, scheme):
+        return self.options.proxy.get(scheme) if self.options.proxy else None
+
+    def _request(self, method, url, body, headers):
+        """
+        Sends the request on a pooled connection. A reused connection may
+        have been closed by the server in the meantime, so the request is
+        retried on a new connection, but only if it failed before it reached
+        the server. The requests which may have been processed (e.g. after a
+        timeout) are never sent twice.
+        :return: tuple, (response, body)
+        """
+        parts = urlparse.urlsplit(url)
+        key = (parts.scheme, parts.netloc)
+        proxy = self._get_proxy(parts.scheme)
+        selector = parts.path or '/'
+        if parts.query:
+            selector = '%s?%s' % (selector, parts.query)
+        if proxy and parts.scheme == 'http':
+            selector = url
+
+        while True:
+            connection, reused = self.pool.acquire(key, self.options.timeout,
+                                                   proxy)
+            try:
+                response, data = self._send_on(connection, method, selector,
+                                               body, headers)
+            except StaleConnectionError, e:
+                self.pool.discard(connection)
+                if reused:
+                    continue
+                raise urllib2.URLError(e.error)
+            except (httplib.HTTPException, socket.error), e:
+                self.pool.discard(connection)
+                raise urllib2.URLError(e)
+
+            if response.will_close:
+                self.pool.discard(connection)
+            else:
+                self.pool.release(key, connection)
+            return response, data
+
+    def _send_on(self, connection, method, selector, body, headers):
+        """
+        Sends the request on the connection and reads the whole response.
+        Raises StaleConnectionError if the connection failed before the
+        request reached the server
+        """
+        try:
+            connection.request(method, selector, body, headers)
+        except socket.timeout:
+            raise
+        except (httplib.HTTPException, socket.error), e:
+            raise StaleConnectionError(e)
+
+        try:
+            response = connection.getresponse()
+        except httplib.BadStatusLine, e:
+            # The server closed the connection without reading the request
+            if e.line in ('', "''"):
+                raise StaleConnectionError(e)
+            raise
+        return response, response.read()
+
+    def __deepcopy__(self, memo={}):
+        # The suds clone copies the options, share the pool with the clones
+        return self
+
+
+class PooledHttpAuthenticated(PooledHttpTransport):
+    """
+    Provides basic http authentication on pooled connections.
+    """
+
+    def open(self, request):
+        self.addcredentials(request)
+        return PooledHttpTransport.open(self, request)
+
+    def send(self, request):
+        self.addcredentials(request)
+        return PooledHttpTransport.send(self, request)
+
+    def addcredentials(self, request):
+        credentials = (self.options.username, self.options.password)
+        if None not in credentials:
+            encoded = base64.b64encode(':'.join(credentials))
+            request.headers['Authorization'] = 'Basic %s' % encoded
+
+
+class PooledNTLMAuthenticated(PooledHttpTransport):
+    """
+    Provides Windows (NTLM) http authentication on pooled connections. NTLM
+    authenticates the connection and not the request, so the handshake is
+    done once per connection and the authenticated connections are reused
+    by the next requests (also for the other endpoints of the same host).
+    The handshake is repeated only when the server responds with 401.
+    @ivar scheme: The scheme of the Authorization header.
+    """
+    challenge_re = re.compile(r'(?:NTLM|Negotiate) ([A-Za-z0-9+/=]+)')
+
+    def __init__(self, pool=None, scheme='Negotiate', **kwargs):
+        PooledHttpTransport.__init__(self, pool=pool, **kwargs)
+        self.scheme = scheme
+
+    def _get_credentials(self):
+        """
+        Splits the DOMAIN\\user username.
+        :return: tuple, (user, domain, negotiate flags)
+        """
+        try:
+            from ntlm3 import ntlm
+        except ImportError:
+            raise Exception("Cannot import python-ntlm3 module")
+
+        parts = self.options.username.split('\\', 1)
+        if len(parts) == 1:
+            return (parts[0], '', ntlm.NTLM_TYPE1_FLAGS &
+                    ~ntlm.NTLM_NegotiateOemDomainSupplied)
+        return parts[1], parts[0].upper(), ntlm.NTLM_TYPE1_FLAGS
+
+    def _send_on(self, connection, method, selector, body, headers):
+        if getattr(connection, 'ntlm_authenticated', False):
+            response, data = PooledHttpTransport._send_on(
+                self, connection, method, selector, body, headers)
+            if response.status != 401:
+                return response, data
+            # The server dropped the authentication of the connection
+            connection.ntlm_authenticated = False
+            if response.will_close:
+                return response, data
+
+        return self._authenticate(connection, method, selector, body, headers)
+
+    def _authenticate(self, connection, method, selector, body, headers):
+        """
+        Does the negotiate/challenge/authenticate handshake on the
+        connection and sends the request
+        """
+        from ntlm3 import ntlm
+
+        user, domain, flags = self._get_credentials()
+        headers = dict(headers)
+        headers['Connection'] = 'Keep-Alive'
+        headers['Authorization'] = '%s %s' % (
+            self.scheme, ntlm.create_NTLM_NEGOTIATE_MESSAGE(
+                self.options.username, flags))
+        response, data = PooledHttpTransport._send_on(
+            self, connection, method, selector, body, headers)
+        if response.status != 401 or response.will_close:
+            return response, data
+
+        match = self.challenge_re.search(
+            response.getheader('www-authenticate', ''))
+        if not match:
+            return response, data
+
+        challenge, flags = ntlm.parse_NTLM_CHALLENGE_MESSAGE(match.group(1))
+        headers['Authorization'] = '%s %s' % (
+            self.scheme, ntlm.create_NTLM_AUTHENTICATE_MESSAGE(
+                challenge, user, domain, self.options.password, flags))
+        response, data = PooledHttpTransport._send_on(
+            self, connection, method, selector, body, headers)
+        connection.ntlm_authenticated = response.status != 401
+        return response, data
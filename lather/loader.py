@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+import copy
+import logging
+import threading
+
+from .exceptions import ObjectDoesNotExist
+from .exceptions import MultipleObjectReturned
+from .query import LOOKUP_SEP
+from .query import is_literal
+
+log = logging.getLogger('lather_client')
+
+
+def copy_object(obj):
+    """
+    Copies the object and its lists, e.g. the keys of the companies
+    """
+    clone = copy.copy(obj)
+    for name, value in obj.__dict__.items():
+        if isinstance(value, list):
+            setattr(clone, name, [copy.copy(v) for v in value])
+    return clone
+
+
+class Deferred(object):
+    """
+    The result of a get which is loaded by a BatchLoader. The result() (or
+    the access of an attribute of the object) flushes the loader, if the
+    batch isn't loaded yet, and returns the object or raises the exception
+    of the get. The attributes are read from and set to the object, but
+    isinstance and the operators need the object of the result()
+    """
+
+    def __init__(self, loader, kwargs):
+        self._loader = loader
+        self._kwargs = kwargs
+        self._event = threading.Event()
+        self._result = None
+        self._error = None
+
+    def __repr__(self):
+        if not self.done():
+            return '<Deferred: %r>' % self._kwargs
+        return '<Deferred: %r>' % (self._error or self._result)
+
+    def __getattr__(self, item):
+        if item.startswith('_'):
+            raise AttributeError(item)
+        return getattr(self.result(), item)
+
+    def __setattr__(self, name, value):
+        if name.startswith('_'):
+            super(Deferred, self).__setattr__(name, value)
+        else:
+            setattr(self.result(), name, value)
+
+    def done(self):
+        return self._event.is_set()
+
+    def set_result(self, result):
+        self._result = result
+        self._event.set()
+
+    def set_error(self, error):
+        self._error = error
+        self._event.set()
+
+    def result(self):
+        if not self.done():
+            self._loader.flush()
+            self._event.wait()
+
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+
+class BatchLoader(object):
+    """
+    Collects the get calls and executes them in one filter per field, e.g.
+    the gets of No='A' and No='B' are loaded with the filter No__in=['A',
+    'B'], which is one ReadMultiple call per company. The pending gets are
+    executed at the flush, when the result of one of them is accessed, at
+    the end of the batch and, if the window (in seconds) is set, window
+    seconds after the first pending get
+    """
+
+    def __init__(self, manager, window=None):
+        self.manager = manager
+        self.window = window
+        self._pending = []
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.flush()
+
+    def _get_field(self, kwargs):
+        """
+        Return the field name of the get if it can be batched: a single
+        exact lookup of a literal value
+        """
+        if len(kwargs) != 1:
+            return None
+
+        field, value = kwargs.items()[0]
+        if LOOKUP_SEP in field or value is None or not is_literal(value):
+            return None
+        return field
+
+    def load(self, **kwargs):
+        """
+        Adds the get to the batch and returns its Deferred result
+        """
+        deferred = Deferred(self, kwargs)
+        with self._lock:
+            self._pending.append(deferred)
+            if self.window is not None and self._timer is None:
+                self._timer = threading.Timer(self.window, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        return deferred
+
+    def flush(self):
+        """
+        Executes the pending gets
+        """
+        with self._lock:
+            pending, self._pending = self._pending, []
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+        fields = {}
+        for deferred in pending:
+            field = self._get_field(deferred._kwargs)
+            if field is None:
+                self._get(deferred)
+            else:
+                fields.setdefault(field, []).append(deferred)
+
+        for field, deferreds in fields.items():
+            self._load_field(field, deferreds)
+
+    def _get(self, deferred):
+        try:
+            deferred.set_result(self.manager.queryset_class(
+                self.manager, self.manager.model).get(**deferred._kwargs))
+        except Exception, e:
+            deferred.set_error(e)
+
+    def _load_field(self, field, deferreds):
+        values = list(set([d._kwargs[field] for d in deferreds]))
+        log.debug('[%s] Loading %s objects by %s in a batch'
+                  % (log.name.upper(), len(values), field))
+        queryset = self.manager.queryset_class(self.manager,
+                                               self.manager.model)
+        try:
+            objects = {}
+            for obj in queryset.filter(**{'%s__in' % field: values}):
+                value = unicode(getattr(obj, field))
+                objects.setdefault(value, []).append(obj)
+        except Exception, e:
+            for deferred in deferreds:
+                deferred.set_error(e)
+            return
+
+        seen = set()
+        for deferred in deferreds:
+            value = unicode(deferred._kwargs[field])
+            found = objects.get(value, [])
+            # Every get of the same value receives its own objects
+            if value in seen:
+                found = [copy_object(obj) for obj in found]
+            seen.add(value)
+
+            # The result is the one of a get, which for many objects is
+            # either an error or a queryset
+            queryset = self.manager.queryset_class(self.manager,
+                                                   self.manager.model)
+            queryset.queryset = found
+            try:
+                deferred.set_result(queryset._get_result())
+            except (ObjectDoesNotExist, MultipleObjectReturned), e:
+                deferred.set_error(e)
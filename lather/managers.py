@@ -1,11 +1,22 @@
 # -*- coding: utf-8 -*-
+import time
 import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
 
 from .decorators import require_client
 from .decorators import require_default
 from .exceptions import ObjectDoesNotExist
 from .exceptions import ObjectsDoNotExist
 from .exceptions import MultipleObjectReturned
+from .loader import BatchLoader
+from .query import Q
+from .query import compile_filters
+from .cache import to_records
+from .cache import DEFAULT_TIMEOUT
+from .utils import chunks
+from .utils import map_concurrently
 
 from suds import WebFault
 
@@ -27,28 +38,72 @@ class Instance(object):
         return '<%s>' % path
 
 
+class CompanyResult(object):
+    """
+    The result of a write action at a company
+    """
+    SUCCESS, FAILED, SKIPPED = 'success', 'failed', 'skipped'
+
+    def __init__(self, company, status, key=None, fault=None):
+        self.company = company
+        self.status = status
+        self.key = key
+        self.fault = fault
+
+    def __repr__(self):
+        path = '%s.%s' % (self.__class__.__module__, self.__class__.__name__)
+        return '<%s: (%s, %s)>' % (path, self.company, self.status)
+
+
+class WriteReport(list):
+    """
+    The results of a write action per company. It's true when the action
+    succeeded at least at one company and didn't fail at any company, so
+    the failed companies can be retried
+    """
+
+    def __nonzero__(self):
+        return bool(self.succeeded) and not self.failed
+
+    @property
+    def succeeded(self):
+        return [r for r in self if r.status == CompanyResult.SUCCESS]
+
+    @property
+    def failed(self):
+        return [r for r in self if r.status == CompanyResult.FAILED]
+
+    def get_failed_companies(self):
+        return [r.company for r in self.failed]
+
+
 class BaseQuerySet(object):
     def __init__(self, manager, model):
         self.manager = manager
         self.model = model
-        self.queryset = None
-        self.client = self._connect()
+        self._result_cache = None
+        self._filters = []
+        self._filtered = False
+        self._client = None
 
     def __len__(self):
         return self.count()
 
     def __iter__(self):
-        if not self.queryset:
+        if self.queryset is None:
             raise Exception('No queryset found')
 
         return iter(self.queryset)
 
     def __getitem__(self, item):
-        if not self.queryset:
+        if self.queryset is None:
             raise Exception('No queryset found')
 
         return self.queryset[item]
 
+    def __nonzero__(self):
+        return bool(self.queryset)
+
     def __repr__(self):
         path = '%s.%s' % (self.__class__.__module__, self.__class__.__name__)
         queryset = getattr(self, 'queryset', None)
@@ -60,6 +115,87 @@ class BaseQuerySet(object):
                 return '[%s]' % ', '.join([str(r) for r in queryset])
         return '<%s>' % path
 
+    @property
+    def client(self):
+        """
+        The connection to the page, resolved at the first call which needs
+        it and shared by the querysets of the manager
+        """
+        if self._client is None:
+            self._client = self.manager.connection
+        return self._client
+
+    @client.setter
+    def client(self, value):
+        self._client = value
+
+    @property
+    def queryset(self):
+        """
+        The results of the queryset. The filtered querysets call the api at
+        the first access and cache the results
+        """
+        if self._result_cache is None and self._filtered:
+            self._fetch_all()
+        return self._result_cache
+
+    @queryset.setter
+    def queryset(self, value):
+        self._result_cache = value
+
+    def _clone(self):
+        """
+        Return an unevaluated copy of the queryset with the same filters
+        """
+        clone = self.__class__(self.manager, self.model)
+        clone._filters = self._filters[:]
+        clone._filtered = self._filtered
+        return clone
+
+    def _add_filters(self, *args, **kwargs):
+        self._filters.append(Q(*args, **kwargs))
+        self._filtered = True
+
+    def _get_criteria(self, *args, **kwargs):
+        """
+        Return the filters compiled to a list of (criteria, predicate). Every
+        item is a ReadMultiple call, its records are filtered by the
+        predicate at the client and the results of all the items are merged
+        """
+        filters = Q(*(self._filters + [Q(*args, **kwargs)]))
+        return compile_filters(filters, self.model._meta.max_criteria_length)
+
+    def _filter_all(self, client, criteria):
+        """
+        Return the records of all the criteria without the duplicates
+        """
+        records = []
+        for kwargs, predicate in criteria:
+            try:
+                response = self._filter(client, **kwargs)
+            except ObjectsDoNotExist:
+                continue
+
+            if predicate:
+                response = [r for r in response if predicate(r)]
+            records.extend(response)
+
+        if len(criteria) > 1:
+            records = self._unique_records(records)
+        return records
+
+    def _unique_records(self, records):
+        seen = set()
+        for record in records:
+            id = self._get_response_id(record)
+            if id not in seen:
+                seen.add(id)
+                yield record
+
+    def _fetch_all(self):
+        self._result_cache = list(self._filter_all(self.client,
+                                                   self._get_criteria()))
+
     def _connect(self, *args, **kwargs):
         """
         Central method which makes the connection to the api
@@ -83,7 +219,21 @@ class BaseQuerySet(object):
             params.update({self.model.__name__: kwargs.get('attrs')})
             return getattr(client, method)(**params)
 
-        return getattr(client, method)(**kwargs)
+        return self._call(client, method, **kwargs)
+
+    def _call(self, client, method, *args, **kwargs):
+        """
+        Calls the method. The concurrent identical calls of the read
+        methods share one request
+        """
+        single_flight = getattr(self.model.client, 'single_flight', None)
+        if single_flight and method in self.model._meta.get_read_methods():
+            key = (client.endpoint, method, repr(args),
+                   repr(sorted(kwargs.items())))
+            return single_flight.do(
+                key, lambda: getattr(client, method)(*args, **kwargs))
+
+        return getattr(client, method)(*args, **kwargs)
 
     def _check_kwargs(self, method, **kwargs):
         page = self.model._meta.page
@@ -112,22 +262,107 @@ class BaseQuerySet(object):
     def _get_response_id(self, response):
         return getattr(response, self.model._meta.default_id)
 
+    def _get_write_attrs(self, obj):
+        """
+        Cleans the object and returns the values of its fields (declared and
+        discovered) which are sent at the create and update
+        """
+        obj.clean()
+        return dict((field, getattr(obj, field)) for field in
+                    self.model._meta.get_field_names() if
+                    field not in self.model._meta.exclude_fields)
+
+    def _bulk_query(self, client, method, records):
+        """
+        Sends the records with one call of a multiple records method
+        (CreateMultiple, UpdateMultiple) and returns the records of the
+        response in the same order
+        """
+        index = 0
+        params = {}
+        if self.model._meta.journal:
+            # The first parameter of the journal pages is the batch name
+            params.update({'CurrentJnlBatchName': self.model._meta.journal})
+            index = 1
+        param = str(client.get_service_params(method)[index][0])
+        params.update({param: {self.model.__name__: records}})
+        try:
+            return self._get_records(getattr(client, method)(**params))
+        finally:
+            self.model._meta.invalidate_results()
+
+    def _in_bulk_by_field(self, values, field_name):
+        values = list(values)
+        if not values:
+            return {}
+
+        queryset = self.filter(**{'%s__in' % field_name: values})
+        return dict((getattr(obj, field_name), obj) for obj in queryset)
+
     @require_client
     def create(self, **kwargs):
+        return self._create(self.client, **kwargs)
+
+    def _create(self, client, **kwargs):
         attrs = dict(attrs=kwargs)
-        return self._query(self.client, self.model._meta.create, **attrs)
+        try:
+            return self._query(client, self.model._meta.create, **attrs)
+        finally:
+            self.model._meta.invalidate_results()
 
     @require_client
     def update(self, **kwargs):
+        return self._update(self.client, **kwargs)
+
+    def _update(self, client, **kwargs):
         attrs = dict(attrs=kwargs)
-        return self._query(self.client, self.model._meta.update, **attrs)
+        try:
+            return self._query(client, self.model._meta.update, **attrs)
+        finally:
+            self.model._meta.invalidate_results()
 
     @require_client
     def get(self, **kwargs):
+        return self._get(self.client, **kwargs)
+
+    def _get_cached(self, key, func):
+        """
+        Return the result of the func from the result cache of the model,
+        if it's enabled
+        """
+        meta = self.model._meta
+        cache = meta.get_result_cache()
+        if cache is None:
+            return func()
+
+        key = ('result', meta.page, meta.cache_version) + key
+        # Without the cache_timeout the results expire with the timeout of
+        # the backend
+        timeout = meta.cache_timeout
+        if timeout is None:
+            timeout = DEFAULT_TIMEOUT
+        if not cache.in_process:
+            # The suds objects can't be pickled
+            return cache.get_or_set(key, lambda: to_records(func()), timeout)
+        return cache.get_or_set(key, func, timeout)
+
+    def _get_result(self):
+        """
+        Return the result of a get from the objects of the queryset
+        """
+        if not self.queryset:
+            raise ObjectDoesNotExist('Object not found')
+        if len(self.queryset) > 1:
+            raise MultipleObjectReturned('This function can return only one '
+                                         'object but the query returned '
+                                         'multiple results. Use all instead')
+        return self.queryset[0]
+
+    def _get(self, client, **kwargs):
         # When the result is None the suds raise AttributeError, handle
         # this error to return ObjectNotFound
         try:
-            response = self._query(self.client, self.model._meta.get, **kwargs)
+            response = self._query(client, self.model._meta.get, **kwargs)
         except AttributeError:
             raise ObjectDoesNotExist('Object not found')
 
@@ -140,13 +375,19 @@ class BaseQuerySet(object):
 
     @require_client
     def delete(self, **kwargs):
+        return self._delete(self.client, **kwargs)
+
+    def _delete(self, client, **kwargs):
         id = kwargs.get(self.model._meta.default_id, None)
         if not id:
             raise Exception('You have to provide a keyword: %s'
                             % self.model._meta.default_id)
 
-        if not self._query(self.client, self.model._meta.delete, **kwargs):
-            return False
+        try:
+            if not self._query(client, self.model._meta.delete, **kwargs):
+                return False
+        finally:
+            self.model._meta.invalidate_results()
 
         return True
 
@@ -155,42 +396,125 @@ class BaseQuerySet(object):
         return iter(self._query(self.client, self.model._meta.all))
 
     @require_client
-    def filter(self, **kwargs):
+    def filter(self, *args, **kwargs):
+        """
+        Return a new queryset with the filters (Q objects or keywords with
+        lookups) added to the existing. The api is called when the queryset
+        is evaluated
+        """
+        clone = self._clone()
+        clone._add_filters(*args, **kwargs)
+        return clone
+
+    @require_client
+    def exclude(self, *args, **kwargs):
+        """
+        Return a new queryset which excludes the objects matching the filters
+        """
+        clone = self._clone()
+        clone._add_filters(~Q(*args, **kwargs))
+        return clone
+
+    def _make_filter_params(self, client, **kwargs):
         index = 0
         params = {}
         filters = []
 
-        service_params = self.client.get_service_params(self.model._meta.filter)
+        method = self.model._meta.filter
+        service_params = client.get_service_params(method)
 
         if self.model._meta.journal:
             params.update({'CurrentJnlBatchName': self.model._meta.journal})
             index = 1
         params.update({'filter': filters})
 
+        filter_type = service_params[index][1].type[0]
         for k in kwargs.keys():
-            filter = self.client.factory(service_params[index][1].type[0])
+            filter = client.factory(filter_type)
             setattr(filter, 'Field', k)
             setattr(filter, 'Criteria', kwargs.get(k))
             filters.append(filter)
 
-        # TODO: Try pipe filters
+        return params, client.index.get_param_names(method)
+
+    def _get_records(self, response):
+        """
+        Return the list of the records of a ReadMultiple response
+        """
+        # An empty response is None or text instead of a list object
+        if not hasattr(response, '__keylist__'):
+            return []
+
         try:
-            response = iter(
-                getattr(self.client, self.model._meta.filter)(**params)[0]
-            )
+            records = response[0]
         except IndexError:
+            return []
+
+        # Suds doesn't return a list when the response contains one record
+        if not isinstance(records, list):
+            records = [records]
+        return records
+
+    def _read_pages(self, client, page_size=None, **kwargs):
+        """
+        Generator which reads the filtered records page by page. Every page
+        continues after the key of the last record of the previous page
+        (bookmark key), until a page returns less records than the page size
+        """
+        params, service_params = self._make_filter_params(client, **kwargs)
+        if 'setSize' not in service_params:
+            page_size = None
+        if page_size:
+            params['setSize'] = page_size
+
+        while True:
+            response = self._call(client, self.model._meta.filter, **params)
+            records = self._get_records(response)
+            if records:
+                yield records
+
+            if not page_size or len(records) < page_size:
+                return
+            params['bookmarkKey'] = self._get_response_id(records[-1])
+
+    def _filter(self, client, **kwargs):
+        records = []
+        for page in self._read_pages(client, self.model._meta.page_size,
+                                     **kwargs):
+            records.extend(page)
+
+        if not records:
             raise ObjectsDoNotExist('Objects not found')
 
-        return response
+        return iter(records)
+
+    def _iterator(self, client, criteria, chunk_size=None):
+        """
+        Generator which yields the records of all the criteria, keeping in
+        memory only one page of chunk_size records
+        """
+        if chunk_size is None:
+            chunk_size = self.model._meta.page_size
+
+        def records():
+            for kwargs, predicate in criteria:
+                for page in self._read_pages(client, chunk_size, **kwargs):
+                    for record in page:
+                        if predicate is None or predicate(record):
+                            yield record
+
+        if len(criteria) > 1:
+            return self._unique_records(records())
+        return records()
 
     def count(self):
         """
         Return the number of the results if the queryset exists
         """
-        if not self.queryset:
+        if self.queryset is None:
             raise Exception('No queryset found')
 
-        return len(list(self.queryset))
+        return len(self.queryset)
 
 
 class QuerySet(BaseQuerySet):
@@ -232,7 +556,9 @@ class QuerySet(BaseQuerySet):
 
         self.queryset = []
 
-        response = super(QuerySet, self).get(**kwargs)
+        key = ('get', tuple(sorted(kwargs.items())))
+        response = self._get_cached(
+            key, lambda: super(QuerySet, self).get(**kwargs))
 
         inst = self._create_inst(response)
         self.queryset.append(inst)
@@ -335,59 +661,200 @@ class QuerySet(BaseQuerySet):
             created = True
         return inst, created
 
-    @require_client
-    def filter(self, **kwargs):
+    def _fetch_all(self):
+        response = self._filter_all(self.client, self._get_criteria())
+
         self.queryset = []
-        response = super(QuerySet, self).filter(**kwargs)
         for result in response:
-            inst = self._create_inst(response)
+            inst = self._create_inst(result)
             self.queryset.append(inst)
 
-        return self
+    @require_client
+    def iterator(self, chunk_size=None, **kwargs):
+        """
+        Yield the filtered objects, requesting chunk_size objects per call
+        """
+        criteria = self._get_criteria(**kwargs)
+        for record in self._iterator(self.client, criteria, chunk_size):
+            yield self._create_inst(record)
+
+    @require_client
+    def in_bulk(self, keys, field_name=None):
+        """
+        Returns a dict of the objects by key, which are read with a get per
+        key, or by the value of the field_name which is read with filters of
+        as few calls as possible
+        """
+        if field_name:
+            return self._in_bulk_by_field(keys, field_name)
+
+        objects = {}
+        for key in keys:
+            try:
+                record = self._get(self.client,
+                                   **{self.model._meta.default_id: key})
+            except (ObjectDoesNotExist, WebFault):
+                continue
+            objects[key] = self._create_inst(record)
+        return objects
+
+    @require_client
+    def bulk_create(self, objs, batch_size=None):
+        """
+        Creates the objects with one call per batch_size objects
+        """
+        return self._bulk_write(self.model._meta.bulk_create, objs,
+                                batch_size)
+
+    @require_client
+    def bulk_update(self, objs, batch_size=None):
+        """
+        Updates the objects with one call per batch_size objects
+        """
+        return self._bulk_write(self.model._meta.bulk_update, objs,
+                                batch_size, update=True)
+
+    def _bulk_write(self, method, objs, batch_size=None, update=False):
+        if batch_size is None:
+            batch_size = self.model._meta.batch_size
+
+        for batch in chunks(objs, batch_size):
+            records = []
+            for obj in batch:
+                attrs = self._get_write_attrs(obj)
+                if update:
+                    attrs[self.model._meta.default_id] = obj.get_id()
+                records.append(attrs)
+
+            response = self._bulk_query(self.client, method, records)
+            for obj, record in zip(batch, response):
+                self._create_inst(record, obj)
+
+        return objs
 
 
 class NavQuerySet(BaseQuerySet):
-    def __init__(self, manager, model):
-        self.manager = manager
-        self.model = model
-        self.queryset = None
+    def _map_companies(self, func, companies=None):
+        """
+        Calls the function for every company (or Instance) concurrently and
+        returns the results in the order of the companies
+        """
+        if companies is None:
+            companies = self.model.client.companies
+        return map_concurrently(func, companies,
+                                self.model.client.max_workers,
+                                self.model.client.executor)
+
+    def _write(self, func, instances, missing=False):
+        """
+        Calls the write function, func(client, instance), for every Instance
+        concurrently. The SOAP faults are recorded at the report, as skipped
+        when the object may not exist at the company (missing).
+        :return: tuple, (report, [(result, client, response),...])
+        """
+        def write(instance):
+            client = instance.client or self._connect(instance.company)
+            try:
+                return client, func(client, instance), None
+            except WebFault, e:
+                return client, None, e
+
+        report = WriteReport()
+        responses = []
+        results = self._map_companies(write, instances)
+        for instance, (client, response, fault) in zip(instances, results):
+            if fault is not None:
+                status = CompanyResult.FAILED
+                if missing:
+                    status = CompanyResult.SKIPPED
+            elif response is False:
+                status = CompanyResult.FAILED
+            else:
+                status = CompanyResult.SUCCESS
+
+            result = CompanyResult(instance.company, status, instance.id,
+                                   fault)
+            report.append(result)
+            if status == CompanyResult.FAILED:
+                log.warning('[%s] Write at the company %s failed: %s'
+                            % (log.name.upper(), instance.company, fault))
+            elif status == CompanyResult.SUCCESS:
+                responses.append((result, client, response))
+
+        return report, responses
+
+    def _raise_if_failed(self, report):
+        """
+        Raises the first fault if the action failed at all the companies
+        """
+        if report.succeeded:
+            return
+
+        for result in report:
+            if result.fault is not None:
+                raise result.fault
+
+    def _merge_instances(self, instances):
+        """
+        Merges the equal objects of different companies to one object which
+        contains the keys of all the companies. The objects are compared
+        after all of them are populated, because the fields of the model may
+        be discovered by the later objects
+        """
+        merged = OrderedDict()
+        for inst in instances:
+            obj = merged.setdefault(inst, inst)
+            if obj is not inst:
+                # TODO: Test keys (if are the same at all companies ) and
+                # TODO: give Warning about this
+                obj.get_instances().extend(inst.get_instances())
+
+        return merged.keys()
 
     @require_client
     def create(self, obj=None, companies=None, **kwargs):
-        if obj:
-            # Send the create action to the appropriate companies
-            for instance in obj.get_instances():
-                # If the instance object contains the id attribute then came
-                # from the update_or_create() -> update() -> create() because
-                # the user added some new companies, so the object contains
-                # some instance objects with id
-                if instance.id:
-                    continue
-                self.client = instance.client
-                if not self.client:
-                    self.client = self._connect(instance.company)
+        def create(client, instance):
+            return self._create(client, **kwargs)
 
-                response = super(NavQuerySet, self).create(**kwargs)
+        if obj:
+            # Send the create action to the appropriate companies. If the
+            # instance object contains the id attribute then came from the
+            # update_or_create() -> update() -> create() because the user
+            # added some new companies, so the object contains some instance
+            # objects with id
+            instances = [i for i in obj.get_instances() if not i.id]
+            report, responses = self._write(create, instances)
+            self._raise_if_failed(report)
+            for result, client, response in responses:
                 obj.populate_attrs(response)
-                obj.add_id(instance.company, self.client,
-                            self._get_response_id(response))
+                result.key = self._get_response_id(response)
+                obj.add_id(result.company, client, result.key)
+            obj.report = report
         else:
             inst = None
             if not companies:
                 companies = self.model.client.companies
-            for company in companies:
-                self.client = self._connect(company)
-                response = super(NavQuerySet, self).create(**kwargs)
+            instances = [Instance(company) for company in companies]
+            report, responses = self._write(create, instances)
+            self._raise_if_failed(report)
+            for result, client, response in responses:
                 if not inst:
                     inst = self.model()
                     inst.populate_attrs(response)
-                inst.add_id(company, self.client,
-                             self._get_response_id(response))
+                result.key = self._get_response_id(response)
+                inst.add_id(result.company, client, result.key)
+            if inst:
+                inst.report = report
 
             return inst
 
     @require_client
     def update(self, obj=None, companies=None, delete=False, **kwargs):
+        def update(client, instance):
+            params = dict(kwargs)
+            params.update({self.model._meta.default_id: instance.id})
+            return self._update(client, **params)
+
         if obj:
             # This if will be true when the previous function is the
             # update_or_create
@@ -424,18 +891,10 @@ class NavQuerySet(BaseQuerySet):
                     add_companies = new_add_companies[:]
 
 
+                    update_instances = []
                     for instance in inst.get_instances():
                         if instance.company in update_companies:
-                            kwargs.update(
-                                { self.model._meta.default_id: instance.id })
-                            #self.client = instance.client
-                            #if not self.client:
-                            self.client = self._connect(instance.company)
-
-                            response = super(NavQuerySet, self).update(**kwargs)
-                            inst.populate_attrs(response)
-                            inst.add_id(instance.company, self.client,
-                                         self._get_response_id(response))
+                            update_instances.append(instance)
                         elif instance.company in delete_companies:
                             if isinstance(delete, dict):
                                 delete.update(
@@ -451,21 +910,27 @@ class NavQuerySet(BaseQuerySet):
                                                 str(instance.id)}
                                 self.delete(**tmp_dict)
                                 inst.remove_id(instance)
+
+                    report, responses = self._write(update, update_instances)
+                    self._raise_if_failed(report)
+                    for result, client, response in responses:
+                        inst.populate_attrs(response)
+                        result.key = self._get_response_id(response)
+                        inst.add_id(result.company, client, result.key)
+                    inst.report = report
+
                     # Now create the new entries
                     if add_companies:
                         inst.add_companies(add_companies)
                         inst.save()
             else:
-                for instance in obj.get_instances():
-                    kwargs.update({self.model._meta.default_id: instance.id})
-                    self.client = instance.client
-                    if not self.client:
-                        self.client = self._connect(instance.company)
-
-                    response = super(NavQuerySet, self).update(**kwargs)
+                report, responses = self._write(update, obj.get_instances())
+                self._raise_if_failed(report)
+                for result, client, response in responses:
                     obj.populate_attrs(response)
-                    obj.add_id(instance.company, self.client,
-                                self._get_response_id(response))
+                    result.key = self._get_response_id(response)
+                    obj.add_id(result.company, client, result.key)
+                obj.report = report
         else:
             inst = None
             ids = kwargs.pop(self.model._meta.default_id, None)
@@ -478,41 +943,29 @@ class NavQuerySet(BaseQuerySet):
                     if not isinstance(instance, Instance):
                         raise TypeError('The list must contain Key objects')
 
-                    self.client = instance.client
-                    if not self.client:
-                        self.client = self._connect(instance.company)
-                    kwargs.update({self.model._meta.default_id: instance.id})
-                    response = super(NavQuerySet, self).update(**kwargs)
-                    if not inst:
-                        inst = self.model()
-                        inst.populate_attrs(response)
-                    inst.add_id(instance.company, self.client,
-                                 self._get_response_id(response))
+                report, responses = self._write(update, ids)
+                self._raise_if_failed(report)
             else:
                 # TODO: Does not work for some reason, maybe needs the company
                 if not companies:
                     companies = self.model.client.companies
-                skipped = 0
-                for company in companies:
-                    self.client = self._connect(company)
-                    kwargs.update({self.model._meta.default_id: ids})
-                    # because whenever tries to update something which
-                    # doesn't exist raise this error
-                    try:
-                        response = super(NavQuerySet, self).update(**kwargs)
-                    except WebFault:
-                        skipped += 1
-                        continue
-
-                    if not inst:
-                        inst = self.model()
-                        inst.populate_attrs(response)
-                    inst.add_id(company, self.client,
-                                 self._get_response_id(response))
-
-                if skipped == len(companies):
+                # Because whenever tries to update something which doesn't
+                # exist raise a fault, the companies with faults are skipped
+                instances = [Instance(company, ids) for company in companies]
+                report, responses = self._write(update, instances,
+                                                missing=True)
+                if not report.succeeded:
                     raise ObjectDoesNotExist('Object not found')
 
+            for result, client, response in responses:
+                if not inst:
+                    inst = self.model()
+                    inst.populate_attrs(response)
+                result.key = self._get_response_id(response)
+                inst.add_id(result.company, client, result.key)
+            if inst:
+                inst.report = report
+
             return inst
 
     @require_client
@@ -520,36 +973,34 @@ class NavQuerySet(BaseQuerySet):
         #TODO: The following line cause one request more
         #self._check_kwargs(self.model._meta.get, **kwargs)
 
-        self.queryset = []
-        companies = self.model.client.companies
-        for company in companies:
-            self.client = self._connect(company)
+        def read(company):
+            client = self._connect(company)
             try:
-                response = super(NavQuerySet, self).get(**kwargs)
+                return company, self._get(client, **kwargs)
             except ObjectDoesNotExist:
-                continue
+                return company, None
+
+        def read_companies():
+            return [(company, response) for company, response in
+                    self._map_companies(read) if response is not None]
 
+        companies = self.model.client.companies
+        key = ('get', tuple(companies), tuple(sorted(kwargs.items())))
+        instances = []
+        for company, response in self._get_cached(key, read_companies):
+            client = self._connect(company)
             inst = self.model()
             inst.populate_attrs(response)
-            inst.add_id(company, self.client, self._get_response_id(response))
-
-            if self.queryset:
-                found = False
-                for obj in self.queryset:
-                    # TODO: Test keys (if are the same at all companies ) and
-                    # TODO: give Warning about this
-                    if inst == obj:
-                        obj_keys = obj.get_instances()
-                        inst_keys = inst.get_instances()
-                        obj_keys.extend(inst_keys)
-                        found = True
-
-                if not found:
-                    self.queryset.append(inst)
-
-            else:
-                self.queryset.append(inst)
+            inst.add_id(company, client, self._get_response_id(response))
+            instances.append(inst)
+        self.queryset = self._merge_instances(instances)
+        return self._get_result()
 
+    def _get_result(self):
+        """
+        Return the result of a get from the objects of the queryset: the
+        object, or the queryset if the companies returned different objects
+        """
         if len(self.queryset) > 1:
             return self
         elif len(self.queryset) == 1:
@@ -559,37 +1010,35 @@ class NavQuerySet(BaseQuerySet):
 
     @require_client
     def delete(self, obj=None, companies=None, **kwargs):
-        success = True
+        def delete(client, instance):
+            return self._delete(client,
+                                **{self.model._meta.default_id: instance.id})
+
         if obj:
             # Send the delete action to the appropriate companies
-            for instance in obj.get_instances():
-                self.client = instance.client
-                if not self.client:
-                    self.client = self._connect(instance.company)
-                tmp_dict = {self.model._meta.default_id: instance.id}
-                if not super(NavQuerySet, self).delete(**tmp_dict):
-                    success = False
+            report, responses = self._write(delete, obj.get_instances())
+            self._raise_if_failed(report)
+            return report
         else:
             # Send the delete action to all the companies
             ids = kwargs.get(self.model._meta.default_id, None)
             if self.queryset and not ids:
-                tmp_list = self.queryset[:]
+                keys = [instance for inst in self.queryset
+                        for instance in inst.get_instances()]
+                report = self._bulk_delete(keys)
+                failed = set([(result.company, result.key)
+                              for result in report.failed])
+                # Keep the objects with the keys which weren't deleted
+                queryset = []
                 for inst in self.queryset:
-                    success = True
-                    for instance in inst.get_instances():
-                        if not isinstance(instance, Instance):
-                            raise TypeError(
-                                'The list must contain Key objects')
-                        self.client = instance.client
-                        if not self.client:
-                            self.client = self._connect(instance.company)
-                        tmp_dict = {self.model._meta.default_id: instance.id}
-                        if not super(NavQuerySet, self).delete(**tmp_dict):
-                            success = False
-                    if success:
-                        tmp_list.pop(tmp_list.index(inst))
-                # Assign the undeleted objects
-                self.queryset = tmp_list[:]
+                    instances = inst.get_instances()
+                    instances[:] = [i for i in instances
+                                    if (i.company, i.id) in failed]
+                    if instances:
+                        queryset.append(inst)
+                self.queryset = queryset
+                self._raise_if_failed(report)
+                return report
             else:
                 if not ids:
                     raise Exception('You have to provide a keyword: %s'
@@ -600,31 +1049,168 @@ class NavQuerySet(BaseQuerySet):
                         if not isinstance(instance, Instance):
                             raise TypeError(
                                 'The list must contain Key objects')
-                        self.client = instance.client
-                        if not self.client:
-                            self.client = self._connect(instance.company)
-                        tmp_dict = {self.model._meta.default_id: instance.id}
-                        if not super(NavQuerySet, self).delete(**tmp_dict):
-                            success = False
-
+                    report, responses = self._write(delete, ids)
+                    self._raise_if_failed(report)
                 else:
                     if not companies:
                         companies = self.model.client.companies
-                    skipped = 0
-                    for company in companies:
-                        self.client = self._connect(company)
-                        # because whenever tries to delete something which
-                        # doesn't exist raise this error
-                        try:
-                            if not super(NavQuerySet, self).delete(**kwargs):
-                                success = False
-                        except WebFault:
-                            skipped += 1
-                            continue
-
-                    if skipped == len(companies):
-                        success = False
-        return success
+                    # Because whenever tries to delete something which
+                    # doesn't exist raise a fault, the companies with faults
+                    # are skipped
+                    instances = [Instance(company, ids)
+                                 for company in companies]
+                    report, responses = self._write(delete, instances,
+                                                    missing=True)
+                return report
+
+    def _connect_companies(self, companies):
+        """
+        Connects once per company
+        :return: dict, {company: client,...}
+        """
+        clients = {}
+        for company in companies:
+            if company not in clients:
+                clients[company] = self._connect(company)
+        return clients
+
+    def _read_by_rec_id(self, client, key, rec_id=None):
+        """
+        Reads the record of the key, None if it doesn't exist. The record id
+        is requested from the key, unless it's given
+        """
+        meta = self.model._meta
+        if rec_id is None:
+            rec_id = self._call(client, meta.rec_id, key)
+        return self._call(client, meta.get_by_rec_id, rec_id)
+
+    @require_client
+    def in_bulk(self, keys, field_name=None, companies=None):
+        """
+        Returns a dict of the objects by key. NAV has no batch read by key,
+        so every key costs calls, which run concurrently:
+        - Instance objects are read only at their company, with a
+          GetRecIdFromKey and a ReadByRecId call
+        - key strings are read at the companies (default all the companies).
+          The record id doesn't depend on the company, so it's requested
+          once per key and it's read with a ReadByRecId call per company
+        With the field_name, the keys are values of this field and are read
+        with filters, one ReadMultiple call per company for every
+        max_criteria_length of values, which is the cheapest way to read
+        many objects
+        """
+        if field_name:
+            return self._in_bulk_by_field(keys, field_name)
+
+        meta = self.model._meta
+        instances = [key for key in keys if isinstance(key, Instance)]
+        strings = [key for key in keys if not isinstance(key, Instance)]
+        if strings:
+            companies = list(companies or self.model.client.companies)
+        else:
+            companies = []
+        clients = self._connect_companies(
+            [instance.company for instance in instances
+             if instance.client is None] + companies)
+
+        def get_rec_id(key):
+            try:
+                return self._call(clients[companies[0]], meta.rec_id, key)
+            except WebFault, e:
+                log.debug('[%s] Key %s not found: %s'
+                          % (log.name.upper(), key, e))
+                return None
+
+        reads = [(instance, None) for instance in instances]
+        rec_ids = map_concurrently(get_rec_id, strings,
+                                   self.model.client.max_workers,
+                                   self.model.client.executor)
+        for key, rec_id in zip(strings, rec_ids):
+            if rec_id is not None:
+                reads.extend([(Instance(company, key), rec_id)
+                              for company in companies])
+
+        def read(item):
+            instance, rec_id = item
+            client = instance.client or clients[instance.company]
+            try:
+                return client, self._read_by_rec_id(client, instance.id,
+                                                    rec_id)
+            except WebFault, e:
+                log.debug('[%s] Key %s not found at the company %s: %s'
+                          % (log.name.upper(), instance.id, instance.company,
+                             e))
+                return client, None
+
+        results = map_concurrently(read, reads,
+                                   self.model.client.max_workers,
+                                   self.model.client.executor)
+        objects = {}
+        for (instance, rec_id), (client, record) in zip(reads, results):
+            if record is None:
+                continue
+
+            key = self._get_response_id(record)
+            if key not in objects:
+                objects[key] = self.model()
+                objects[key].populate_attrs(record)
+            objects[key].add_id(instance.company, client, key)
+
+        return objects
+
+    def _bulk_delete(self, keys, max_workers=None):
+        """
+        Deletes the keys (Instance objects) with max_workers concurrent
+        calls (by default on the executor of the client)
+        :return: WriteReport
+        """
+        for instance in keys:
+            if not isinstance(instance, Instance):
+                raise TypeError('The list must contain Key objects')
+
+        clients = self._connect_companies(
+            [instance.company for instance in keys if instance.client is None])
+
+        def delete(instance):
+            client = instance.client or clients[instance.company]
+            try:
+                if self._delete(client, **{self.model._meta.default_id:
+                                               instance.id}):
+                    return CompanyResult.SUCCESS, None
+            except WebFault, e:
+                log.warning('[%s] Delete of %s at the company %s failed: %s'
+                            % (log.name.upper(), instance.id,
+                               instance.company, e))
+                return CompanyResult.FAILED, e
+            return CompanyResult.FAILED, None
+
+        # An explicit max_workers gets its own pool, otherwise the deletes
+        # run on the executor of the client
+        executor = None
+        if max_workers is None:
+            max_workers = self.model.client.max_workers
+            executor = self.model.client.executor
+        results = map_concurrently(delete, keys, max_workers, executor)
+        report = WriteReport()
+        for instance, (status, fault) in zip(keys, results):
+            report.append(CompanyResult(instance.company, status, instance.id,
+                                        fault))
+        return report
+
+    @require_client
+    def bulk_delete(self, keys=None, max_workers=None):
+        """
+        Deletes the keys (Instance objects), by default the keys of all the
+        objects of the queryset, with max_workers concurrent calls (by
+        default on the executor of the client) and returns the set of
+        (company, key) which failed
+        """
+        if keys is None:
+            keys = [instance for inst in self.queryset or []
+                    for instance in inst.get_instances()]
+
+        report = self._bulk_delete(keys, max_workers)
+        return set([(result.company, result.key) for result in report.failed])
 
     @require_client
     def all(self):
@@ -709,40 +1295,138 @@ class NavQuerySet(BaseQuerySet):
             created = True
         return inst, created
 
-    @require_client
-    def filter(self, **kwargs):
-        self.queryset = []
-        companies = self.model.client.companies
-        for company in companies:
-            self.client = self._connect(company)
-            try:
-                response = super(NavQuerySet, self).filter(**kwargs)
-            except ObjectsDoNotExist:
-                continue
+    def _fetch_all(self):
+        criteria = self._get_criteria()
 
+        def read_multiple(company):
+            client = self._connect(company)
+            return company, client, list(self._filter_all(client, criteria))
+
+        instances = []
+        for company, client, response in self._map_companies(read_multiple):
             for result in response:
                 log.debug('[%s] From the company %s we got the result: %s'
                           % (log.name.upper(), company, result))
                 inst = self.model()
                 inst.populate_attrs(result)
-                inst.add_id(company, self.client,
-                             self._get_response_id(result))
-
-                if self.queryset:
-                    found = False
-                    for obj in self.queryset:
-                        if inst == obj:
-                            obj_keys = obj.get_instances()
-                            inst_keys = inst.get_instances()
-                            obj_keys.extend(inst_keys)
-                            found = True
-
-                    if not found:
-                        self.queryset.append(inst)
-                else:
-                    self.queryset.append(inst)
+                inst.add_id(company, client, self._get_response_id(result))
+                instances.append(inst)
+        self.queryset = self._merge_instances(instances)
 
-        return self
+    @require_client
+    def iterator(self, chunk_size=None, companies=None, **kwargs):
+        """
+        Yield the filtered objects company by company, requesting chunk_size
+        objects per call. Unlike the filter, the equal objects of different
+        companies are not merged, every object contains only the key of its
+        company
+        """
+        if companies is None:
+            companies = self.model.client.companies
+
+        criteria = self._get_criteria(**kwargs)
+        for company in companies:
+            client = self._connect(company)
+            for record in self._iterator(client, criteria, chunk_size):
+                inst = self.model()
+                inst.populate_attrs(record)
+                inst.add_id(company, client, self._get_response_id(record))
+                yield inst
+
+    @require_client
+    def bulk_create(self, objs, batch_size=None, companies=None):
+        """
+        Creates the objects at their companies without key with one call
+        per batch_size objects per company. The objects without companies
+        are created at the companies (default all the companies)
+        """
+        targets = []
+        for obj in objs:
+            if not obj.get_companies():
+                obj.add_companies(companies or self.model.client.companies)
+
+            attrs = self._get_write_attrs(obj)
+            for instance in obj.get_instances():
+                if not instance.id:
+                    targets.append((instance.company, obj, attrs))
+
+        self._bulk_write(self.model._meta.bulk_create, objs, targets,
+                         batch_size)
+        return objs
+
+    @require_client
+    def bulk_update(self, objs, batch_size=None):
+        """
+        Updates the objects at all their companies with one call per
+        batch_size objects per company
+        """
+        targets = []
+        for obj in objs:
+            attrs = self._get_write_attrs(obj)
+            for instance in obj.get_instances():
+                if instance.id:
+                    company_attrs = dict(attrs)
+                    company_attrs[self.model._meta.default_id] = instance.id
+                    targets.append((instance.company, obj, company_attrs))
+
+        self._bulk_write(self.model._meta.bulk_update, objs, targets,
+                         batch_size)
+        return objs
+
+    def _bulk_write(self, method, objs, targets, batch_size=None):
+        """
+        Sends the targets, [(company, obj, attrs),...], in batches per
+        company, with the companies written concurrently. The result of
+        every company is added to the report of the object and the fault is
+        raised only if all the batches failed
+        """
+        if batch_size is None:
+            batch_size = self.model._meta.batch_size
+
+        companies = OrderedDict()
+        for company, obj, attrs in targets:
+            companies.setdefault(company, []).append((obj, attrs))
+
+        def write(company):
+            client = self._connect(company)
+            results = []
+            for batch in chunks(companies[company], batch_size):
+                records = [attrs for obj, attrs in batch]
+                try:
+                    results.append((batch, self._bulk_query(client, method,
+                                                            records), None))
+                except WebFault, e:
+                    log.warning('[%s] Write of %s objects at the company %s '
+                                'failed: %s' % (log.name.upper(), len(batch),
+                                                company, e))
+                    results.append((batch, [], e))
+            return client, results
+
+        for obj in objs:
+            obj.report = WriteReport()
+
+        report = WriteReport()
+        responses = self._map_companies(write, companies.keys())
+        for company, (client, results) in zip(companies.keys(), responses):
+            for batch, records, fault in results:
+                if fault is not None:
+                    for obj, attrs in batch:
+                        result = CompanyResult(company, CompanyResult.FAILED,
+                                               fault=fault)
+                        obj.report.append(result)
+                        report.append(result)
+                    continue
+
+                for (obj, attrs), record in zip(batch, records):
+                    obj.populate_attrs(record)
+                    key = self._get_response_id(record)
+                    obj.add_id(company, client, key)
+                    result = CompanyResult(company, CompanyResult.SUCCESS, key)
+                    obj.report.append(result)
+                    report.append(result)
+
+        self._raise_if_failed(report)
+        return report
 
 
 class Manager(object):
@@ -750,20 +1434,68 @@ class Manager(object):
 
     def __init__(self, model):
         self.model = model
+        self._local = threading.local()
+        self._connection = None
+
+    @property
+    def connection(self):
+        """
+        The connection to the page of the model, reused by all the calls of
+        the manager until the connections of the client are invalidated or
+        expire
+        """
+        client = self.model.client
+        connection = self._connection
+        if connection is None or connection[0] is not client or \
+                connection[1] != client.generation or \
+                connection[2] <= time.time():
+            # Read the generation before the connect, so an invalidation
+            # during the connect is not missed
+            generation = client.generation
+            timeout = client.clients.timeout
+            expires = time.time() + timeout if timeout else float('inf')
+            connection = (client, generation, expires,
+                          client.connect(self.model._meta.page))
+            self._connection = connection
+        return connection[3]
+
+    @contextmanager
+    def batch(self, window=None):
+        """
+        Inside the batch the get of the current thread returns a Deferred
+        result and the gets are loaded together, see BatchLoader
+        """
+        previous = getattr(self._local, 'loader', None)
+        loader = BatchLoader(self, window)
+        self._local.loader = loader
+        try:
+            yield loader
+        finally:
+            self._local.loader = previous
+            loader.flush()
+
+    def get(self, **kwargs):
+        loader = getattr(self._local, 'loader', None)
+        if loader is not None:
+            return loader.load(**kwargs)
+        return self.queryset_class(self, self.model).get(**kwargs)
 
     def __getattr__(self, item):
         log.debug('[%s] Calling manager __getattr__: %s' % (log.name.upper(),
                                                             item))
-        if hasattr(self.queryset_class, item):
-            def wrapper(*args, **kwargs):
-                log.debug('[%s] called with %r and %r' % (log.name.upper(),
-                                                          args, kwargs))
-                queryset = self.queryset_class(self, self.model)
-                func = getattr(queryset, item)
-                return func(*args, **kwargs)
-
-            return wrapper
-        raise AttributeError(item)
+        if item.startswith('_') or not hasattr(self.queryset_class, item):
+            raise AttributeError(item)
+
+        def wrapper(*args, **kwargs):
+            log.debug('[%s] called with %r and %r' % (log.name.upper(),
+                                                      args, kwargs))
+            queryset = self.queryset_class(self, self.model)
+            func = getattr(queryset, item)
+            return func(*args, **kwargs)
+
+        # Cache the wrapper, so the next accesses don't call the __getattr__
+        self.__dict__[item] = wrapper
+        return wrapper
 
 
 class NavManager(Manager):
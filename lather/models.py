@@ -1,7 +1,9 @@
 # -*- coding: utf-8 -*-
-import sys
 import logging
+import threading
+import uuid
 
+from .cache import LRUCache
 from .exceptions import ValidationError
 from .exceptions import FieldException
 from .decorators import require_client
@@ -9,6 +11,7 @@ from .managers import Manager
 from .managers import NavManager
 from .managers import BaseQuerySet, QuerySet, NavQuerySet
 from .managers import Instance
+from .query import Q
 
 log = logging.getLogger('lather_client')
 
@@ -69,6 +72,20 @@ class Field(object):
         return value
 
 
+def make_endpoint_method(endpoint):
+    """
+    Return a queryset method which calls the SOAP method of the endpoint
+    (an attribute of the options of the model) with the connection of the
+    queryset
+    """
+    def method(self, **kwargs):
+        return self._query(self.client, getattr(self.model._meta, endpoint),
+                           **kwargs)
+
+    method.__name__ = endpoint
+    return method
+
+
 class Options(object):
     def __init__(self, meta=None):
         self.meta = meta
@@ -79,6 +96,22 @@ class Options(object):
         self.declared_fields = []
         self.discovered_fields = []
         self.exclude_fields = []
+        self._comparable_fields = (None, [])
+        # Number of records which the filter requests per call
+        self.page_size = 1000
+        # Maximum length of a filter criteria, the longer lists of the in
+        # lookup are split to many calls
+        self.max_criteria_length = 250
+        # Number of records which the bulk actions send per call
+        self.batch_size = 100
+        # The results of the get are cached for cache_timeout seconds, if
+        # it's set, at the cache_backend (by default an in-process LRU cache
+        # of cache_max_entries)
+        self.cache_timeout = None
+        self.cache_max_entries = 128
+        self.cache_backend = None
+        self._result_cache = None
+        self._cache_lock = threading.Lock()
         self._page = None
         self._default_endpoints = (
             ('create', {
@@ -96,6 +129,12 @@ class Options(object):
             }),
             ('filter', {
                 'method': 'ReadMultiple'
+            }),
+            ('bulk_create', {
+                'method': 'CreateMultiple'
+            }),
+            ('bulk_update', {
+                'method': 'UpdateMultiple'
             })
         )
 
@@ -104,18 +143,11 @@ class Options(object):
             if endpoints.get(endpoint):
                 setattr(self, endpoint, endpoints[endpoint]['method'])
 
-                # Attach a general method to the BaseQuerySet which can handle
-                # these calls
+                # Attach a method to the BaseQuerySet which calls the method
+                # of the endpoint of the queryset's model
                 if not hasattr(BaseQuerySet, endpoint):
-                    def func(cls, **kwargs):
-                        method_name = sys._getframe().f_back.f_code.co_name
-
-                        client = cls._connect()
-                        return cls._query(client,
-                                          getattr(self, method_name),
-                                          **kwargs)
-
-                    setattr(BaseQuerySet, endpoint, func)
+                    setattr(BaseQuerySet, endpoint,
+                            make_endpoint_method(endpoint))
 
     #TODO: Deprecated
     def add_default_codeunit_page(self):
@@ -155,6 +187,67 @@ class Options(object):
         return list(set([f.name for f in self.declared_fields] +
                         [f.name for f in self.discovered_fields]))
 
+    def get_result_cache(self):
+        """
+        Return the cache of the results, None if it's disabled
+        """
+        if self.cache_backend is not None:
+            return self.cache_backend
+        if not self.cache_timeout:
+            return None
+
+        with self._cache_lock:
+            if self._result_cache is None:
+                self._result_cache = LRUCache(self.cache_max_entries,
+                                              self.cache_timeout)
+        return self._result_cache
+
+    @property
+    def cache_version(self):
+        """
+        The version of the cached results of the page. It's stored at the
+        cache backend, so the processes which share the backend invalidate
+        the results of each other
+        """
+        cache = self.get_result_cache()
+        if cache is None:
+            return None
+
+        return cache.get_or_set(('version', self.page),
+                                lambda: uuid.uuid4().hex, timeout=None)
+
+    def invalidate_results(self):
+        """
+        Invalidates the cached results after a write. The cache keys contain
+        the version, so the old entries are never read and the results of
+        the reads which run during the write are not used
+        """
+        cache = self.get_result_cache()
+        if cache is not None:
+            cache.set(('version', self.page), uuid.uuid4().hex, timeout=None)
+
+    def get_read_methods(self):
+        """
+        Return the methods which only read, so the concurrent identical
+        calls can share the request
+        """
+        return set([self.get, self.filter])
+
+    def get_comparable_field_names(self):
+        """
+        Return a sorted list of names of the fields which are compared at the
+        __eq__ and __hash__ of the model (all the fields except the
+        exclude_fields). The list is cached until the fields change
+        """
+        token = (id(self.declared_fields), len(self.declared_fields),
+                 id(self.discovered_fields), len(self.discovered_fields),
+                 tuple(self.exclude_fields))
+        if self._comparable_fields[0] != token:
+            names = sorted([f for f in self.get_field_names()
+                            if f not in self.exclude_fields])
+            self._comparable_fields = (token, names)
+        return self._comparable_fields[1]
+
     def get_declared_field_names(self):
         """
         Return a list of names of the declared fields
@@ -204,6 +297,13 @@ class NavOptions(Options):
         super(NavOptions, self).__init__(meta)
         self.manager = NavManager
         self.journal = None
+        # Methods which read a record by its key
+        self.rec_id = 'GetRecIdFromKey'
+        self.get_by_rec_id = 'ReadByRecId'
+
+    def get_read_methods(self):
+        return super(NavOptions, self).get_read_methods() | set(
+            [self.rec_id, self.get_by_rec_id])
 
 
 class BaseModel(type):
@@ -363,10 +463,7 @@ class Model(object):
         """
         Exam if two objects are equal
         """
-        for field in self._meta.get_field_names():
-            if field in self._meta.exclude_fields:
-                continue
-
+        for field in self._meta.get_comparable_field_names():
             try:
                 if getattr(self, field) != getattr(other, field):
                     return False
@@ -375,6 +472,25 @@ class Model(object):
 
         return True
 
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        """
+        Hash of the compared fields, so the equal objects have the same hash
+        """
+        values = []
+        for field in self._meta.get_comparable_field_names():
+            value = getattr(self, field, None)
+            try:
+                hash(value)
+            except TypeError:
+                # Unhashable values (e.g. lists) are compared only by __eq__
+                value = type(value).__name__
+            values.append(value)
+
+        return hash(tuple(values))
+
     def _add_discoved_field(self, attr):
         """
         Add undeclared fields from the reponse to the discovered_fields
@@ -383,19 +499,17 @@ class Model(object):
             self._meta.add_discovered_field_from_name(attr)
 
     def populate_attrs(self, response):
-        # Remove id from the keylist because it's handled from the add_key
-        try:
-            response.__keylist__.pop(
-                response.__keylist__.index(self._meta.default_id))
-        except ValueError:
-            pass
+        # Skip the id because it's handled from the add_key. The response is
+        # not changed, because it may be cached and populate other objects
+        keylist = [attr for attr in response.__keylist__
+                   if attr != self._meta.default_id]
         # Suds keylist sometimes does not contain all the fields, because
         # they do not contain any info. If these fields are specified at
         # the model definition, add them with the default value.
         # unresolved_fields: contains the field names which are specified but
         # they don't contained to the response
         unresolved_fields = self._meta.get_declared_field_names()
-        for attr in response.__keylist__:
+        for attr in keylist:
             try:
                 unresolved_fields.pop(unresolved_fields.index(attr))
             except ValueError:
@@ -477,6 +591,8 @@ class NavModel(Model):
     def __init__(self, *args, **kwargs):
         # Initialize the default_id to an empty list
         setattr(self, self._meta.default_id, [])
+        # The WriteReport of the last write action per company
+        self.report = None
         super(NavModel, self).__init__(*args, **kwargs)
 
     def add_companies(self, companies):
@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+import itertools
+from collections import OrderedDict
+
+LOOKUP_SEP = '__'
+LOOKUPS = ('exact', 'ne', 'in', 'gt', 'gte', 'lt', 'lte', 'range',
+           'startswith', 'endswith', 'contains')
+
+# Characters with special meaning at the NAV filter criteria
+SPECIAL_CHARACTERS = "&|()<>=.*@'?"
+
+
+class Q(object):
+    """
+    Encapsulates filters which can be combined with the & and | operators
+    and negated with the ~ operator
+    """
+    AND = 'AND'
+    OR = 'OR'
+
+    def __init__(self, *args, **kwargs):
+        self.children = list(args) + sorted(kwargs.items())
+        self.connector = self.AND
+        self.negated = False
+
+    def __repr__(self):
+        children = ', '.join([repr(c) for c in self.children])
+        if self.negated:
+            return '<Q: NOT (%s: %s)>' % (self.connector, children)
+        return '<Q: (%s: %s)>' % (self.connector, children)
+
+    def _combine(self, other, connector):
+        if not isinstance(other, Q):
+            raise TypeError(other)
+
+        q = Q()
+        q.connector = connector
+        q.children = [self, other]
+        return q
+
+    def __or__(self, other):
+        return self._combine(other, self.OR)
+
+    def __and__(self, other):
+        return self._combine(other, self.AND)
+
+    def __invert__(self):
+        q = Q()
+        q.connector = self.connector
+        q.children = self.children[:]
+        q.negated = not self.negated
+        return q
+
+    def to_dnf(self, negate=False):
+        """
+        Return the filters as a list of alternatives (OR), every one a list
+        of (keyword, value, negate) which all must match (AND). The negations
+        are moved to the filters
+        """
+        if not self.children:
+            return [[]]
+
+        negate = negate != self.negated
+        connector = self.connector
+        if negate:
+            connector = self.OR if connector == self.AND else self.AND
+
+        alternatives = []
+        for child in self.children:
+            if isinstance(child, Q):
+                alternatives.append(child.to_dnf(negate))
+            else:
+                alternatives.append([[(child[0], child[1], negate)]])
+
+        if connector == self.OR:
+            return [c for alternative in alternatives for c in alternative]
+
+        results = []
+        for combination in itertools.product(*alternatives):
+            results.append([f for filters in combination for f in filters])
+        return results
+
+
+def quote(value):
+    """
+    Quotes the value, if it contains special characters, so the NAV
+    criteria matches it literally
+    """
+    value = value if isinstance(value, basestring) else str(value)
+    if value and not [c for c in value if c in SPECIAL_CHARACTERS]:
+        return value
+
+    return "'%s'" % value.replace("'", "''")
+
+
+def is_literal(value):
+    """
+    Exam if the value can be used at a wildcard criteria
+    """
+    value = value if isinstance(value, basestring) else str(value)
+    return value and not [c for c in value if c in SPECIAL_CHARACTERS]
+
+
+def parse_lookup(key):
+    """
+    Splits the filter keyword to the field name and the lookup
+    """
+    if LOOKUP_SEP in key:
+        field, lookup = key.rsplit(LOOKUP_SEP, 1)
+        if lookup in LOOKUPS:
+            return field, lookup
+    return key, 'exact'
+
+
+def join_criteria(values, max_length=None):
+    """
+    Joins the quoted values with the | operator to criteria which are not
+    longer than max_length
+    """
+    criteria = []
+    current = []
+    length = 0
+    for value in values:
+        value = quote(value)
+        if current and max_length and length + len(value) + 1 > max_length:
+            criteria.append('|'.join(current))
+            current = []
+            length = 0
+        length += len(value) + (1 if current else 0)
+        current.append(value)
+
+    if current:
+        criteria.append('|'.join(current))
+    return criteria
+
+
+def make_predicate(field, lookup, value, negate=False):
+    """
+    Return a function which applies the lookup to a record at the client,
+    for the lookups which the NAV criteria can't express
+    """
+    def predicate(record):
+        attr = getattr(record, field, None)
+        if lookup == 'in':
+            result = attr in value
+        elif lookup in ('startswith', 'endswith', 'contains'):
+            if attr is None:
+                result = False
+            elif lookup == 'startswith':
+                result = attr.startswith(value)
+            elif lookup == 'endswith':
+                result = attr.endswith(value)
+            else:
+                result = value in attr
+        else:
+            raise ValueError('Unsupported lookup: %s' % lookup)
+        return result != negate
+
+    return predicate
+
+
+def compile_lookup(field, lookup, value, negate=False, max_length=None):
+    """
+    Returns the alternatives of the lookup, as (criteria, predicate). The
+    results of the alternatives are merged, so a long list of values is
+    split to many criteria. The criteria is None when the lookup doesn't
+    restrict the results at the server and the predicate is None when the
+    criteria is enough
+    """
+    if lookup == 'in':
+        values = list(value)
+        if not negate:
+            return [(c, None) for c in join_criteria(values, max_length)]
+        if not values:
+            return [(None, None)]
+
+        criteria = '&'.join(['<>%s' % quote(v) for v in values])
+        if max_length and len(criteria) > max_length:
+            return [(None, make_predicate(field, lookup, values, negate))]
+        return [(criteria, None)]
+
+    if lookup == 'range':
+        start, end = [quote(v) for v in value]
+        if negate:
+            return [('<%s|>%s' % (start, end), None)]
+        return [('%s..%s' % (start, end), None)]
+
+    if lookup in ('startswith', 'endswith', 'contains'):
+        if negate or not is_literal(value):
+            return [(None, make_predicate(field, lookup, value, negate))]
+
+        patterns = {'startswith': '%s*', 'endswith': '*%s',
+                    'contains': '*%s*'}
+        return [(patterns[lookup] % value, None)]
+
+    # The comparison operators and their negation
+    operators = {
+        'ne': ('<>', ''),
+        'gt': ('>', '<='),
+        'gte': ('>=', '<'),
+        'lt': ('<', '>='),
+        'lte': ('<=', '>'),
+    }
+    if lookup in operators:
+        return [(operators[lookup][negate] + quote(value), None)]
+
+    # The exact lookup passes the value as it is, so it may contain filter
+    # expressions, e.g. 'A*'
+    if negate:
+        return [('<>%s' % value, None)]
+    return [(value, None)]
+
+
+def combine(criteria):
+    """
+    Joins the criteria of a field with the & operator
+    """
+    criteria = [c for c in criteria if c is not None]
+    if not criteria:
+        return None
+    elif len(criteria) == 1:
+        return criteria[0]
+
+    return '&'.join([('(%s)' % c) if '|' in str(c) else str(c)
+                     for c in criteria])
+
+
+def combine_predicates(predicates):
+    predicates = [p for p in predicates if p is not None]
+    if not predicates:
+        return None
+
+    def predicate(record):
+        for p in predicates:
+            if not p(record):
+                return False
+        return True
+
+    return predicate
+
+
+def compile_filters(filters, max_length=None):
+    """
+    Compiles the filters (a Q object) to a list of (criteria, predicate),
+    where the criteria is a dict of the NAV criteria per field and the
+    predicate, if it isn't None, filters the records at the client. Every
+    item is a separate call and the union of their results is the result of
+    the filters
+    """
+    results = []
+    for conjunction in filters.to_dnf():
+        lookups = []
+        for key, value, negate in conjunction:
+            field, lookup = parse_lookup(key)
+            lookups.append([(field, criteria, predicate) for
+                            criteria, predicate in
+                            compile_lookup(field, lookup, value, negate,
+                                           max_length)])
+
+        for combination in itertools.product(*lookups):
+            fields = OrderedDict()
+            for field, criteria, predicate in combination:
+                fields.setdefault(field, []).append(criteria)
+
+            criteria = dict((field, combine(c)) for field, c in fields.items()
+                            if combine(c) is not None)
+            predicate = combine_predicates([p for f, c, p in combination])
+            results.append((criteria, predicate))
+
+    return results
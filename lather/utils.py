@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+import sys
+import threading
+from multiprocessing.pool import ThreadPool
+
+
+_local = threading.local()
+
+
+def map_concurrently(func, items, max_workers=1, executor=None):
+    """
+    Calls the function for every item on a bounded thread pool and returns
+    the results in the order of the items. With an executor (an object with
+    map, e.g. a ThreadPool) the calls run on it and its size bounds them,
+    otherwise a pool is created for the call. The calls made from a thread
+    of the executor run serially, so they don't wait for the threads which
+    wait for them. Exceptions are raised to the caller.
+    """
+    items = list(items)
+    if (not max_workers or max_workers <= 1 or len(items) <= 1 or
+            (executor is not None and
+             getattr(_local, 'executor', None) is executor)):
+        return [func(item) for item in items]
+
+    if executor is not None:
+        def call(item):
+            _local.executor = executor
+            try:
+                return func(item)
+            finally:
+                _local.executor = None
+
+        return list(executor.map(call, items))
+
+    pool = ThreadPool(min(max_workers, len(items)))
+    try:
+        return pool.map(func, items)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def chunks(items, size=None):
+    """
+    Splits the items to lists of size items. Without size, returns all the
+    items in one list
+    """
+    items = list(items)
+    if not size:
+        return [items] if items else []
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+class _Call(object):
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """
+    Coalesces the concurrent calls with the same key: the first caller runs
+    the function and the others wait for it and receive its result (or its
+    exception). Nothing is kept after the call, so it isn't a cache
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, func):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.event.wait()
+            if call.error:
+                raise call.error[0], call.error[1], call.error[2]
+            return call.result
+
+        try:
+            call.result = func()
+        except:
+            call.error = sys.exc_info()
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+        return call.result
@@ -1,14 +1,30 @@
 # -*- coding: utf-8 -*-
 import pytest
 import os
+import re
+from StringIO import StringIO
 
 from jinja2 import Environment, FileSystemLoader
 
+from suds.transport import TransportError
 from suds.transport.http import HttpTransport
 from suds.reader import DocumentReader
 from suds.sax.parser import Parser
 
 
+CUSTOMERS = [
+    dict(key='Key', no='TEST', name='Test'),
+    dict(key='Key2', no='TEST2', name='Test for example'),
+    dict(key='Key3', no='TEST3', name='Test3 for example'),
+]
+
+
+FAULT = ('<soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/'
+         'envelope/"><soap:Body><soap:Fault><faultcode>a:Error</faultcode>'
+         '<faultstring>The record does not exist.</faultstring></soap:Fault>'
+         '</soap:Body></soap:Envelope>')
+
+
 class Reply:
 
     def __init__(self, response):
@@ -46,6 +62,8 @@ def send(transport, request):
         tmp = 'read'
     elif method.startswith('delete'):
         tmp = 'delete'
+    elif method in ('createmultiple', 'updatemultiple'):
+        tmp = 'writemultiple'
 
     filename = '%s.xml' % tmp
     loader = FileSystemLoader(os.path.join(os.path.dirname(__file__), 'mocks'))
@@ -70,6 +88,41 @@ def send(transport, request):
             response = template.render(delete='true')
     elif method == 'delete_fail':
         response = template.render(delete='false')
+    elif method == 'getrecidfromkey':
+        # The keys which start with Missing don't exist
+        key = re.search(r'<(?:\w+:)?Key>([^<]*)<', request.message).group(1)
+        if key.startswith('Missing'):
+            raise TransportError('Fault', 500, StringIO(FAULT))
+        response = template.render(rec_id='RecId:%s' % key)
+    elif method == 'readbyrecid':
+        rec_id = re.search(r'recId>([^<]*)<', request.message).group(1)
+        response = template.render(result=True, key=rec_id.split(':')[1],
+                                   element='ReadByRecId_Result')
+    elif method == 'readmultiple':
+        # Return the page after the bookmark key
+        customers = CUSTOMERS[:]
+        bookmark = re.search(r'bookmarkKey>([^<]*)<', request.message)
+        if bookmark:
+            keys = [c['key'] for c in customers]
+            customers = customers[keys.index(bookmark.group(1)) + 1:]
+        size = re.search(r'setSize>(\d+)<', request.message)
+        if size and int(size.group(1)):
+            customers = customers[:int(size.group(1))]
+        response = template.render(customers=customers)
+    elif tmp == 'writemultiple':
+        # Return the sent customers, with a key per company for the new ones
+        customers = []
+        records = re.findall(r'<(?:\w+:)?Customer>(.*?)</(?:\w+:)?Customer>',
+                             request.message)
+        for record in records:
+            values = dict(re.findall(r'<(?:\w+:)?(\w+)>([^<]*)<', record))
+            key = values.get('Key', '%s-%s' % (company, values.get('No')))
+            customers.append(dict(key=key, no=values.get('No'),
+                                  name=values.get('Name')))
+        result = 'CreateMultiple_Result'
+        if method == 'updatemultiple':
+            result = 'UpdateMultiple_Result'
+        response = template.render(result=result, customers=customers)
     else:
         response = template.render()
 
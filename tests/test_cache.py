@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from lather import cache
+
+
+class TestLRUCache:
+
+    def test_get_set(self):
+        lru = cache.LRUCache()
+        lru.set('key', 'value')
+
+        assert lru.get('key') == 'value'
+        assert lru.get('missing') is None
+        assert lru.get('missing', 'default') == 'default'
+        assert 'key' in lru
+
+    def test_eviction(self):
+        lru = cache.LRUCache(max_entries=2)
+        lru.set('key1', 1)
+        lru.set('key2', 2)
+        # Mark key1 as recently used, so key2 will be evicted
+        lru.get('key1')
+        lru.set('key3', 3)
+
+        assert len(lru) == 2
+        assert 'key1' in lru
+        assert 'key2' not in lru
+        assert 'key3' in lru
+
+    def test_timeout(self):
+        lru = cache.LRUCache(timeout=0)
+        lru.set('key1', 1)
+        lru.set('key2', 2, timeout=None)
+
+        assert lru.get('key1') is None
+        assert lru.get('key2') == 2
+
+    def test_delete_clear(self):
+        lru = cache.LRUCache()
+        lru.set('key1', 1)
+        lru.set('key2', 2)
+        lru.delete('key1')
+
+        assert 'key1' not in lru
+        lru.clear()
+        assert len(lru) == 0
+
+    def test_get_or_set(self):
+        lru = cache.LRUCache()
+        calls = []
+
+        def func():
+            calls.append(1)
+            return 'value'
+
+        assert lru.get_or_set('key', func) == 'value'
+        assert lru.get_or_set('key', func) == 'value'
+        assert len(calls) == 1
+
+    def test_get_or_set_concurrent(self):
+        import time
+        from lather.utils import map_concurrently
+        lru = cache.LRUCache()
+        calls = []
+
+        def func():
+            calls.append(1)
+            time.sleep(0.05)
+            return 'value'
+
+        results = map_concurrently(lambda i: lru.get_or_set('key', func),
+                                   range(5), max_workers=5)
+
+        assert results == ['value'] * 5
+        assert len(calls) == 1
+
+    def test_stats(self):
+        lru = cache.LRUCache(max_entries=1)
+        lru.set('key1', 1)
+        lru.get('key1')
+        lru.get('missing')
+        lru.set('key2', 2)
+
+        assert lru.stats == dict(hits=1, misses=1, evictions=1)
+
+
+class TestFileBasedCache:
+
+    def test_get_set(self, tmpdir):
+        files = cache.FileBasedCache(str(tmpdir))
+        files.set(('key', 1), {'value': [1, 2]})
+
+        assert files.get(('key', 1)) == {'value': [1, 2]}
+        assert files.get('missing', 'default') == 'default'
+        assert files.stats == dict(hits=1, misses=1, evictions=0)
+
+    def test_shared_between_instances(self, tmpdir):
+        cache.FileBasedCache(str(tmpdir)).set('key', 'value')
+        other = cache.FileBasedCache(str(tmpdir))
+
+        assert other.get('key') == 'value'
+        other.delete('key')
+        assert 'key' not in cache.FileBasedCache(str(tmpdir))
+
+    def test_timeout(self, tmpdir):
+        files = cache.FileBasedCache(str(tmpdir), timeout=0)
+        files.set('key1', 1)
+        files.set('key2', 2, timeout=None)
+
+        assert files.get('key1') is None
+        assert files.get('key2') == 2
+        assert len(tmpdir.listdir()) == 1
+
+    def test_cull(self, tmpdir):
+        files = cache.FileBasedCache(str(tmpdir), max_entries=10)
+        for i in range(11):
+            files.set(i, i)
+
+        assert len(tmpdir.listdir()) == 9
+        assert files.stats['evictions'] == 2
+
+    def test_clear(self, tmpdir):
+        files = cache.FileBasedCache(str(tmpdir))
+        files.set('key1', 1)
+        files.set('key2', 2)
+        files.clear()
+
+        assert tmpdir.listdir() == []
+
+
+class TestRecord:
+
+    def test_to_records(self):
+        import pickle
+        from suds.sudsobject import Object
+        obj = Object()
+        obj.Key = 'Key'
+        obj.Name = 'Test'
+        records = cache.to_records([('Company1', obj)])
+        records = pickle.loads(pickle.dumps(records))
+        company, record = records[0]
+
+        assert company == 'Company1'
+        assert record.__keylist__ == ['Key', 'Name']
+        assert record.Name == 'Test'
+
+
+class TestDjangoCache:
+
+    @pytest.fixture
+    def django_cache(self):
+        pytest.importorskip('django')
+        from django.conf import settings
+        if not settings.configured:
+            settings.configure(CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+        from lather.django.cache import DjangoCache
+        backend = DjangoCache()
+        yield backend
+        backend.clear()
+
+    def test_get_set(self, django_cache):
+        django_cache.set(('key', 1), {'value': [1, 2]})
+
+        assert django_cache.get(('key', 1)) == {'value': [1, 2]}
+        assert django_cache.get('missing', 'default') == 'default'
+        assert ('key', 1) in django_cache
+        django_cache.delete(('key', 1))
+        assert ('key', 1) not in django_cache
+        assert django_cache.stats == dict(hits=2, misses=2, evictions=0)
+
+    def test_timeout(self, django_cache):
+        django_cache.set('key1', 1, timeout=0)
+        django_cache.set('key2', 2, timeout=None)
+
+        assert django_cache.get('key1') is None
+        assert django_cache.get('key2') == 2
+        # The keys without timeout never expire
+        assert django_cache.cache._expire_info[
+            django_cache.cache.make_key(django_cache.make_key('key2'))] is None
+
+    def test_clear_keeps_other_keys(self, django_cache):
+        django_cache.set('key', 1)
+        django_cache.cache.set('session', 'value')
+        django_cache.clear()
+
+        assert django_cache.get('key') is None
+        assert django_cache.cache.get('session') == 'value'
+        django_cache.set('key', 2)
+        assert django_cache.get('key') == 2
+        django_cache.cache.delete('session')
+
+    def test_result_cache_version(self, django_cache):
+        from lather import models
+        meta = models.Options()
+        meta.page = 'Page/Customer'
+        meta.cache_backend = django_cache
+        version = meta.cache_version
+
+        assert meta.cache_version == version
+        meta.invalidate_results()
+        assert meta.cache_version != version
+        # Another process which shares the cache reads the same version
+        other = models.Options()
+        other.page = 'Page/Customer'
+        other.cache_backend = django_cache
+        assert other.cache_version == meta.cache_version
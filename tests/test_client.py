@@ -4,7 +4,8 @@ import pytest
 from suds.client import Client
 from suds.transport.https import HttpAuthenticated
 
-from lather import client, models, https, enums
+from lather import client, models, https, enums, exceptions
+from lather.utils import map_concurrently
 from .models import *
 
 
@@ -13,7 +14,10 @@ class TestNavLatherClient:
 
     @pytest.fixture
     def latherclient(self):
-        return client.NavLatherClient('test', cache=None)
+        latherclient = client.NavLatherClient('test', cache=None)
+        # Load the companies, so the tests don't count their request
+        latherclient.companies
+        return latherclient
 
     def test_make_options_ntlm(self):
         latherclient = client.NavLatherClient('test', 'test', 'test')
@@ -30,6 +34,30 @@ class TestNavLatherClient:
         assert options['transport']
         assert isinstance(options['transport'], HttpAuthenticated)
 
+    def test_make_options_pool(self):
+        latherclient = client.NavLatherClient('test', pool_connections=True)
+        options = latherclient._make_options()
+
+        assert isinstance(options['transport'], https.PooledHttpTransport)
+        assert options['transport'].pool is latherclient.pool
+
+    def test_make_options_ntlm_pool(self):
+        latherclient = client.NavLatherClient('test', 'test', 'test',
+                                              pool_connections=True)
+        options = latherclient._make_options()
+
+        assert isinstance(options['transport'], https.PooledNTLMAuthenticated)
+        assert options['transport'].pool is latherclient.pool
+
+    def test_make_options_basic_pool(self):
+        latherclient = client.NavLatherClient('test', 'test', 'test',
+                                              enums.AuthEnums.BASIC,
+                                              pool_connections=True)
+        options = latherclient._make_options()
+
+        assert isinstance(options['transport'], https.PooledHttpAuthenticated)
+        assert options['transport'].pool is latherclient.pool
+
     def test_make_options_proxy(self):
         proxy = dict(
             http="http://test.local:3128",
@@ -45,11 +73,209 @@ class TestNavLatherClient:
 
         assert set(latherclient.companies) == set(companies)
 
+    def test_companies_loaded_lazily(self, monkeypatch):
+        from suds.reader import DocumentReader
+        from suds.transport import TransportError
+
+        def download(reader, url):
+            raise TransportError('Not found', 404)
+
+        monkeypatch.setattr(DocumentReader, 'download', download)
+        latherclient = client.NavLatherClient('test', cache=None)
+
+        with pytest.raises(exceptions.ConnectionError):
+            latherclient.companies
+        assert client.NavLatherClient('test', active=False).companies == [None]
+
+    def test_connect_loads_companies(self):
+        customer_model = type('Customer', (models.NavModel, ),
+                              {'__module__': '__main__'})
+        latherclient = client.NavLatherClient('test', cache=None)
+        latherclient.register(customer_model)
+        connection = customer_model.objects.connection
+
+        assert connection.endpoint == '%s/Page/Customer' % \
+            latherclient.companies[0]
+
+    def test_executor(self):
+        from multiprocessing.pool import ThreadPool
+        pool = ThreadPool(2)
+        latherclient = client.NavLatherClient('test', executor=pool)
+        default = client.NavLatherClient('test', max_workers=3)
+
+        assert latherclient.executor is pool
+        assert default.executor is default.executor
+        assert len(default.executor._pool) == 3
+        pool.close()
+
+    def test_companies_refreshed_in_background(self, latherclient,
+                                               monkeypatch):
+        import time
+        companies = latherclient.companies
+        latherclient.companies = ['Old']
+        now = time.time()
+        monkeypatch.setattr(time, 'time', lambda: now + 3601)
+
+        assert latherclient.companies == ['Old']
+        for i in range(100):
+            if latherclient.companies != ['Old']:
+                break
+            time.sleep(0.01)
+        assert set(latherclient.companies) == set(companies)
+
+    def test_companies_refresh_failure_keeps_companies(self, latherclient,
+                                                       monkeypatch):
+        import time
+
+        def fail():
+            raise exceptions.ConnectionError('Failed')
+
+        monkeypatch.setattr(latherclient, 'update_companies', fail)
+        latherclient.companies = ['Old']
+        latherclient._refresh_companies()
+
+        assert latherclient.companies == ['Old']
+        assert latherclient._companies[1] > time.time()
+
+    def test_companies_cache(self, monkeypatch):
+        from lather.cache import LRUCache
+        from suds.reader import DocumentReader
+        backend = LRUCache()
+        companies = client.NavLatherClient(
+            'test', cache=None, companies_cache=backend).companies
+        monkeypatch.setattr(DocumentReader, 'download', None)
+        latherclient = client.NavLatherClient('test', cache=None,
+                                              companies_cache=backend)
+
+        assert latherclient.companies == companies
+
     def test_connect(self, latherclient):
         wrappersudsclient = latherclient.connect('Customer')
 
         assert isinstance(wrappersudsclient, client.WrapperSudsClient)
 
+    def test_connect_cached(self, latherclient):
+        wrappersudsclient = latherclient.connect('Customer')
+
+        assert latherclient.connect('Customer') is wrappersudsclient
+        assert latherclient.connect('Customer', 'Company2') \
+            is not wrappersudsclient
+
+    def test_connect_cache_timeout(self):
+        latherclient = client.NavLatherClient('test', cache=None,
+                                              client_cache_timeout=0)
+        wrappersudsclient = latherclient.connect('Customer')
+
+        assert latherclient.connect('Customer') is not wrappersudsclient
+
+    def test_connect_parse_wsdl_once(self, latherclient, monkeypatch):
+        from suds.reader import DocumentReader
+        download = DocumentReader.download
+        urls = []
+
+        def counted_download(reader, url):
+            urls.append(url)
+            return download(reader, url)
+
+        monkeypatch.setattr(DocumentReader, 'download', counted_download)
+        clients = [latherclient.connect('Customer', company)
+                   for company in latherclient.companies]
+
+        assert len(urls) == 1
+        for company, wrappersudsclient in zip(latherclient.companies,
+                                              clients):
+            assert wrappersudsclient.endpoint == '%s/Customer' % company
+            assert wrappersudsclient.client.options.location == \
+                '%s/Customer' % company
+            assert wrappersudsclient.client.wsdl is clients[0].client.wsdl
+
+    def test_wsdl_cache_dir(self, monkeypatch, tmpdir):
+        import os
+        from StringIO import StringIO
+        from suds.reader import DocumentReader
+        from suds.transport.http import HttpTransport
+
+        def open_wsdl(transport, request):
+            filename = 'mocks/%s.xml' % request.url.split('/')[-1].lower()
+            with open(os.path.join(os.path.dirname(__file__), filename)) as f:
+                return StringIO(f.read())
+
+        monkeypatch.setattr(HttpTransport, 'open', open_wsdl)
+        latherclient = client.NavLatherClient('test',
+                                              wsdl_cache_dir=str(tmpdir))
+        latherclient.connect('Customer')
+        download = DocumentReader.download
+        urls = []
+
+        def counted_download(reader, url):
+            urls.append(url)
+            return download(reader, url)
+
+        monkeypatch.setattr(DocumentReader, 'download', counted_download)
+        latherclient = client.NavLatherClient('test',
+                                              wsdl_cache_dir=str(tmpdir))
+        wrappersudsclient = latherclient.connect('Customer', 'Company2')
+
+        assert urls == []
+        assert wrappersudsclient.Read(No='Test').Key == 'Key'
+
+    def test_wsdl_cache_backend(self, monkeypatch):
+        import os
+        from StringIO import StringIO
+        from suds.reader import DocumentReader
+        from suds.transport.http import HttpTransport
+        from lather.cache import LRUCache
+
+        def open_wsdl(transport, request):
+            filename = 'mocks/%s.xml' % request.url.split('/')[-1].lower()
+            with open(os.path.join(os.path.dirname(__file__), filename)) as f:
+                return StringIO(f.read())
+
+        monkeypatch.setattr(HttpTransport, 'open', open_wsdl)
+        backend = LRUCache()
+        latherclient = client.NavLatherClient('test', wsdl_cache=backend)
+        latherclient.connect('Customer')
+        download = DocumentReader.download
+        urls = []
+
+        def counted_download(reader, url):
+            urls.append(url)
+            return download(reader, url)
+
+        monkeypatch.setattr(DocumentReader, 'download', counted_download)
+        latherclient = client.NavLatherClient('test', wsdl_cache=backend)
+        wrappersudsclient = latherclient.connect('Customer', 'Company2')
+
+        assert urls == []
+        assert backend.stats['hits'] >= 1
+        assert wrappersudsclient.Read(No='Test').Key == 'Key'
+
+    def test_wsdl_cache_dir_without_fingerprint(self, tmpdir):
+        latherclient = client.NavLatherClient('test',
+                                              wsdl_cache_dir=str(tmpdir))
+        wrappersudsclient = latherclient.connect('Customer')
+
+        assert isinstance(wrappersudsclient, client.WrapperSudsClient)
+        assert tmpdir.listdir() == []
+
+    def test_invalidate(self, latherclient):
+        customer = latherclient.connect('Customer', 'Company1')
+        other = latherclient.connect('Customer', 'Company2')
+        latherclient.invalidate('Customer', 'Company1')
+
+        assert latherclient.connect('Customer', 'Company1') is not customer
+        assert latherclient.connect('Customer', 'Company2') is other
+        latherclient.invalidate()
+        assert latherclient.connect('Customer', 'Company2') is not other
+
+    def test_invalidate_page(self, latherclient):
+        definition = latherclient.get_definition('Customer')
+        customer = latherclient.connect('Customer', 'Company1')
+        latherclient.invalidate('Customer')
+
+        assert latherclient.get_definition('Customer') is not definition
+        assert latherclient.connect('Customer', 'Company1') is not customer
+
     def test_register(self, latherclient):
         latherclient.register(TestModel1)
 
@@ -57,6 +283,40 @@ class TestNavLatherClient:
         assert TestModel1.client == latherclient
         assert isinstance(TestModel1.objects, models.Manager)
 
+    def test_warmup(self, latherclient, monkeypatch):
+        from suds.reader import DocumentReader
+        customer_model = type('Customer', (models.NavModel, ),
+                              {'__module__': '__main__'})
+        latherclient.register(customer_model)
+        results = latherclient.warmup()
+
+        assert len(results) == len(latherclient.companies)
+        for company, (endpoint, elapsed, error) in zip(latherclient.companies,
+                                                       results):
+            assert endpoint == '%s/Page/Customer' % company
+            assert elapsed >= 0
+            assert error is None
+
+        # Everything is loaded, so there are no more downloads
+        monkeypatch.setattr(DocumentReader, 'download', None)
+        for company in latherclient.companies:
+            latherclient.connect('Page/Customer', company)
+
+    def test_warmup_with_errors(self, latherclient, monkeypatch):
+        from suds.reader import DocumentReader
+        from suds.transport import TransportError
+
+        def download(reader, url):
+            raise TransportError('Not found', 404)
+
+        monkeypatch.setattr(DocumentReader, 'download', download)
+        latherclient.register(TestModel1)
+        results = latherclient.warmup(max_workers=1)
+
+        assert len(results) == len(latherclient.companies)
+        for endpoint, elapsed, error in results:
+            assert isinstance(error, exceptions.ConnectionError)
+
     def test_get_service_params(self, latherclient):
         params = latherclient.get_service_params('Read', 'Customer')
 
@@ -83,6 +343,17 @@ class TestWrapperSudsClient:
         with pytest.raises(AttributeError):
             response = wrappersudsclient.Test()
 
+    def test_clone_processes_replies_concurrently(self, wrappersudsclient):
+        clones = [wrappersudsclient.clone('Company%s/Page/Customer' % i)
+                  for i in range(1, 5)]
+        method = clones[0].client.wsdl.services[0].ports[0].methods['Read']
+
+        assert isinstance(method.binding.output.multiref,
+                          client.ReplyMultiRef)
+        results = map_concurrently(
+            lambda c: c.Read_Diff(No='Test').Name, clones * 25, 8)
+        assert results.count('Test_Diff') == 25
+
     def test_get_services(self, wrappersudsclient):
         services = [
             'Delete_Diff', 'Read_Diff', 'ReadMultiple', 'CreateMultiple',
@@ -98,9 +369,55 @@ class TestWrapperSudsClient:
         assert len(params) == 1
         assert str(params[0][0]) == 'No'
 
-
-
-
-
-
-
+    def test_index_shared_by_clones(self, wrappersudsclient):
+        clone = wrappersudsclient.clone('Company1/Page/Customer')
+
+        assert clone.index is wrappersudsclient.index
+        assert clone.index.get_param_names('Read') == ['No']
+        assert clone.index.get_params('Missing') == []
+
+    def test_factory_copies_template(self, wrappersudsclient):
+        first = wrappersudsclient.factory('Customer_Filter')
+        first.Field = 'No'
+        first.Criteria = 'Test'
+        second = wrappersudsclient.factory('Customer_Filter')
+
+        assert second.Field is not first.Field
+        assert second.Criteria is None
+        assert second.__keylist__ == ['Field', 'Criteria']
+
+    def test_dispatch_table_conflicting_names(self, monkeypatch):
+        import os
+        from suds.reader import DocumentReader
+        from suds.sax.parser import Parser
+        filename = os.path.join(os.path.dirname(__file__), 'mocks',
+                                'customer.xml')
+
+        def download(reader, url):
+            # Two operations are named like attributes of the wrapper
+            with open(filename) as f:
+                wsdl = f.read()
+            for old, new in (('Read_NotFound', 'client'),
+                             ('Read_Diff', 'methods')):
+                wsdl = wsdl.replace('operation name="%s"' % old,
+                                    'operation name="%s"' % new)
+            return Parser().parse(string=wsdl)
+
+        monkeypatch.setattr(DocumentReader, 'download', download)
+        wrapper = client.WrapperSudsClient('Customer', cache=None)
+        clone = wrapper.clone('Company1/Page/Customer')
+
+        for wrapper in (wrapper, clone):
+            assert isinstance(wrapper.client, Client)
+            assert isinstance(wrapper.methods, dict)
+            assert wrapper.methods['client'].__name__ == 'client'
+            assert wrapper.methods['methods'].__name__ == 'methods'
+            assert wrapper.Read(No='Test').Key == 'Key'
+
+    def test_dispatch_table(self, wrappersudsclient):
+        clone = wrappersudsclient.clone('Company1/Page/Customer')
+
+        assert sorted(clone.methods) == sorted(clone.get_services())
+        assert clone.Read is clone.methods['Read']
+        assert clone.Read is not wrappersudsclient.Read
+        assert clone.Read(No='Test').Key == 'Key'
@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+import base64
+import time
+import struct
+import threading
+import BaseHTTPServer
+import SocketServer
+
+import pytest
+
+from suds.transport import Request
+from suds.transport import TransportError
+
+from lather import https
+
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def _respond(self, code, body):
+        self.send_response(code)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self._respond(200, 'wsdl')
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        self.server.paths.append(self.path)
+        if self.path == '/fault':
+            self._respond(500, 'fault')
+        elif self.path == '/slow':
+            time.sleep(0.5)
+            self._respond(200, 'slow')
+        else:
+            self._respond(200, 'reply: %s, %s' % (
+                body, self.headers.get('Authorization')))
+
+    def log_message(self, *args):
+        pass
+
+
+class NTLMHandler(Handler):
+    """
+    Authenticates the connection with a fake NTLM handshake
+    """
+    challenge = base64.b64encode(
+        'NTLMSSP\0' + struct.pack('<IHHII', 2, 0, 0, 48, 0x201) +
+        'challeng' + '\0' * 16)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        auth = self.headers.get('Authorization', '')
+        if self.path == '/logout':
+            self.authenticated = False
+        if getattr(self, 'authenticated', False):
+            self._respond(200, 'reply: %s' % body)
+        elif auth.startswith('Negotiate '):
+            message = base64.b64decode(auth.split(' ')[1])
+            message_type = struct.unpack('<I', message[8:12])[0]
+            self.server.handshakes.append(message_type)
+            if message_type == 1:
+                self.send_response(401)
+                self.send_header('WWW-Authenticate',
+                                 'Negotiate %s' % self.challenge)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+            else:
+                self.authenticated = True
+                self._respond(200, 'reply: %s' % body)
+        else:
+            self.send_response(401)
+            self.send_header('WWW-Authenticate', 'Negotiate')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+
+class Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+def serve(handler):
+    httpd = Server(('127.0.0.1', 0), handler)
+    httpd.handshakes = []
+    httpd.paths = []
+    thread = threading.Thread(target=httpd.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return httpd
+
+
+@pytest.fixture
+def server():
+    httpd = serve(Handler)
+    yield 'http://127.0.0.1:%s' % httpd.server_address[1]
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def ntlm_server():
+    httpd = serve(NTLMHandler)
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+class TestPooledHttpTransport:
+
+    def test_send_reuses_connections(self, server):
+        transport = https.PooledHttpTransport()
+        for count in range(3):
+            reply = transport.send(Request(server + '/soap', 'message'))
+            assert reply.message == 'reply: message, None'
+
+        assert transport.pool.stats == dict(created=1, reused=2, discarded=0)
+
+    def test_send_after_idle_timeout(self, server):
+        pool = https.ConnectionPool(idle_timeout=0)
+        transport = https.PooledHttpTransport(pool=pool)
+        transport.send(Request(server + '/soap', 'message'))
+        transport.send(Request(server + '/soap', 'message'))
+
+        assert pool.stats == dict(created=2, reused=0, discarded=1)
+
+    def test_send_reconnects_closed_connection(self, server):
+        transport = https.PooledHttpTransport()
+        transport.send(Request(server + '/soap', 'message'))
+        # Close the socket of the idle connection like an expired keep-alive
+        for connections in transport.pool._idle.values():
+            for connection, last_used in connections:
+                connection.sock.close()
+        reply = transport.send(Request(server + '/soap', 'message'))
+
+        assert reply.message == 'reply: message, None'
+        assert transport.pool.stats['created'] == 2
+
+    def test_send_not_retried_after_timeout(self):
+        import urllib2
+        httpd = serve(Handler)
+        url = 'http://127.0.0.1:%s' % httpd.server_address[1]
+        try:
+            transport = https.PooledHttpTransport(timeout=0.2)
+            transport.send(Request(url + '/soap', 'message'))
+            with pytest.raises(urllib2.URLError):
+                transport.send(Request(url + '/slow', 'message'))
+            time.sleep(0.5)
+
+            assert httpd.paths == ['/soap', '/slow']
+        finally:
+            httpd.shutdown()
+            httpd.server_close()
+
+    def test_send_raise_transport_error(self, server):
+        transport = https.PooledHttpTransport()
+        with pytest.raises(TransportError) as e:
+            transport.send(Request(server + '/fault', 'message'))
+        assert e.value.httpcode == 500
+        assert e.value.fp.read() == 'fault'
+
+    def test_open(self, server):
+        transport = https.PooledHttpTransport()
+        fp = transport.open(Request(server + '/wsdl'))
+
+        assert fp.read() == 'wsdl'
+        assert fp.info() is not None
+
+    def test_pool_size(self, server):
+        pool = https.ConnectionPool(pool_size=0)
+        transport = https.PooledHttpTransport(pool=pool)
+        transport.send(Request(server + '/soap', 'message'))
+
+        assert pool.stats == dict(created=1, reused=0, discarded=1)
+
+    def test_basic_auth(self, server):
+        transport = https.PooledHttpAuthenticated(username='user',
+                                                  password='pass')
+        reply = transport.send(Request(server + '/soap', 'message'))
+
+        assert reply.message == 'reply: message, Basic dXNlcjpwYXNz'
+
+    def test_deepcopy_shares_pool(self):
+        import copy
+        transport = https.PooledHttpTransport()
+
+        assert copy.deepcopy(transport).pool is transport.pool
+
+
+class TestPooledNTLMAuthenticated:
+
+    @pytest.fixture(autouse=True)
+    def ntlm(self, monkeypatch):
+        ntlm = pytest.importorskip('ntlm3.ntlm')
+
+        def authenticate_message(nonce, user, domain, password, flags):
+            # The real message needs md4 which is not always available
+            return base64.b64encode('NTLMSSP\0' + struct.pack('<I', 3))
+
+        monkeypatch.setattr(ntlm, 'create_NTLM_AUTHENTICATE_MESSAGE',
+                            authenticate_message)
+
+    def test_send_authenticates_once(self, ntlm_server):
+        url = 'http://127.0.0.1:%s' % ntlm_server.server_address[1]
+        transport = https.PooledNTLMAuthenticated(username='DOMAIN\\user',
+                                                  password='pass')
+        for page in ('Company1/Page/Customer', 'Company2/Page/Customer'):
+            reply = transport.send(Request('%s/%s' % (url, page), 'message'))
+            assert reply.message == 'reply: message'
+
+        assert ntlm_server.handshakes == [1, 3]
+        assert transport.pool.stats['created'] == 1
+
+    def test_send_authenticates_again_after_401(self, ntlm_server):
+        url = 'http://127.0.0.1:%s' % ntlm_server.server_address[1]
+        transport = https.PooledNTLMAuthenticated(username='user',
+                                                  password='pass')
+        transport.send(Request(url + '/soap', 'message'))
+        reply = transport.send(Request(url + '/logout', 'message'))
+
+        assert reply.message == 'reply: message'
+        assert ntlm_server.handshakes == [1, 3, 1, 3]
+        assert transport.pool.stats['created'] == 1
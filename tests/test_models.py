@@ -307,6 +307,37 @@ class TestNavModel:
 
         assert inst1 != inst2
 
+    def test_hash_of_equal_objects(self):
+        inst1 = test_models.TestModel3(var_test_1='Kwargs1')
+        inst2 = test_models.TestModel3(var_test_1='Kwargs1')
+        inst2.add_id('Company2', None, 'Key2')
+
+        assert hash(inst1) == hash(inst2)
+        assert len(set([inst1, inst2])) == 1
+
+    def test_hash_ignores_exclude_fields(self, monkeypatch):
+        monkeypatch.setattr(test_models.TestModel1._meta, 'exclude_fields',
+                            ['var2'])
+        inst1 = test_models.TestModel1('Args1', 'Args2')
+        inst2 = test_models.TestModel1('Args1', 'Other')
+
+        assert inst1 == inst2
+        assert hash(inst1) == hash(inst2)
+
+    def test_hash_with_unhashable_values(self):
+        inst1 = test_models.TestModel1(['Args1'])
+        inst2 = test_models.TestModel1(['Args1'])
+
+        assert inst1 == inst2
+        assert hash(inst1) == hash(inst2)
+
+    def test_comparable_field_names_follow_discovered_fields(self):
+        meta = test_models.TestModel1._meta
+
+        assert meta.get_comparable_field_names() == ['var1', 'var2']
+        meta.add_discovered_field_from_name('var3')
+        assert meta.get_comparable_field_names() == ['var1', 'var2', 'var3']
+
     def test_get_companies(self):
         companies = ['Company1', 'Company2']
         inst = test_models.TestModel2()
@@ -342,11 +373,153 @@ class TestNavQueryset:
     @pytest.fixture
     def queryset(self, customer_model):
         latherclient = client.NavLatherClient('test', cache=None)
+        # Load the companies, so the tests don't count their request
+        latherclient.companies
         latherclient.register(customer_model)
         return models.NavQuerySet(customer_model.objects, customer_model)
 
+    @pytest.fixture
+    def fault_company(self, monkeypatch):
+        """
+        Responds with a SOAP fault to the requests of the returned companies
+        """
+        from StringIO import StringIO
+        from suds.transport import TransportError
+        from suds.transport.http import HttpTransport
+        send = HttpTransport.send
+        companies = ['Company2']
+        fault = ('<soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/'
+                 'envelope/"><soap:Body><soap:Fault><faultcode>a:Error'
+                 '</faultcode><faultstring>The record already exists.'
+                 '</faultstring></soap:Fault></soap:Body></soap:Envelope>')
+
+        def fault_send(transport, request):
+            if request.url.split('/')[0] in companies:
+                raise TransportError('Fault', 500, StringIO(fault))
+            return send(transport, request)
+
+        monkeypatch.setattr(HttpTransport, 'send', fault_send)
+        return companies
+
+    @pytest.fixture
+    def requests(self, monkeypatch):
+        """
+        Records the sent requests, see utils.SentRequests
+        """
+        from suds.transport.http import HttpTransport
+        send = HttpTransport.send
+        requests = utils.SentRequests()
+        monkeypatch.setattr(
+            HttpTransport, 'send',
+            lambda transport, request: requests.send(send, transport,
+                                                     request))
+        return requests
+
+    @pytest.fixture
+    def sent(self, requests):
+        """
+        Records the SOAP actions of the sent requests
+        """
+        return requests.actions
+
+## cache
+
+    def test_get_cached(self, queryset, sent):
+        queryset.model._meta.cache_timeout = 60
+        companies = queryset.model.client.companies
+        first = queryset.get(No='Test')
+        second = queryset.get(No='Test')
+
+        assert sent.count('Read') == len(companies)
+        assert first is not second
+        assert first.Name == second.Name == 'Test'
+        assert [k.company for k in second.Key] == companies
+
+    def test_get_not_cached_by_default(self, queryset, sent):
+        companies = queryset.model.client.companies
+        queryset.get(No='Test')
+        queryset.get(No='Test')
+
+        assert sent.count('Read') == 2 * len(companies)
+
+    def test_get_cache_key_contains_kwargs(self, queryset, sent):
+        queryset.model._meta.cache_timeout = 60
+        companies = queryset.model.client.companies
+        queryset.get(No='Test')
+        queryset.get(No='Other')
+
+        assert sent.count('Read') == 2 * len(companies)
+
+    def test_get_cache_timeout(self, queryset, sent, monkeypatch):
+        import time
+        queryset.model._meta.cache_timeout = 60
+        companies = queryset.model.client.companies
+        queryset.get(No='Test')
+        now = time.time()
+        monkeypatch.setattr(time, 'time', lambda: now + 61)
+        queryset.get(No='Test')
+
+        assert sent.count('Read') == 2 * len(companies)
+
+    def test_get_cache_invalidated_by_writes(self, queryset, sent):
+        queryset.model._meta.cache_timeout = 60
+        companies = queryset.model.client.companies
+        customer = queryset.get(No='Test')
+        customer.Name = 'Changed'
+        customer.save()
+        queryset.get(No='Test')
+        queryset.delete(obj=customer)
+        queryset.get(No='Test')
+
+        assert sent.count('Read') == 3 * len(companies)
+
+    def test_get_cache_backend(self, queryset, sent, tmpdir, monkeypatch):
+        from lather.cache import FileBasedCache
+        companies = queryset.model.client.companies
+        monkeypatch.setattr(queryset.model._meta, 'cache_backend',
+                            FileBasedCache(str(tmpdir)))
+        queryset.get(No='Test')
+        # Another process which shares the directory
+        backend = FileBasedCache(str(tmpdir))
+        monkeypatch.setattr(queryset.model._meta, 'cache_backend', backend)
+        customer = queryset.get(No='Test')
+
+        assert sent.count('Read') == len(companies)
+        assert customer.Name == 'Test'
+        assert backend.stats['hits'] == 2
+        customer.save()
+        queryset.get(No='Test')
+        assert sent.count('Read') == 2 * len(companies)
+
+    def test_get_cache_backend_timeout(self, queryset, sent, tmpdir,
+                                       monkeypatch):
+        import time
+        from lather.cache import FileBasedCache
+        companies = queryset.model.client.companies
+        monkeypatch.setattr(queryset.model._meta, 'cache_backend',
+                            FileBasedCache(str(tmpdir), timeout=60))
+        queryset.get(No='Test')
+        queryset.get(No='Test')
+        assert sent.count('Read') == len(companies)
+
+        now = time.time()
+        monkeypatch.setattr(time, 'time', lambda: now + 3600)
+        queryset.get(No='Test')
+
+        assert sent.count('Read') == 2 * len(companies)
+
 ## Test get
 
+    def test_populate_attrs_keeps_response(self, queryset):
+        response = queryset.model.client.connect(
+            queryset.model._meta.page, 'Company1').Read(No='Test')
+        customer = queryset.model()
+        customer.populate_attrs(response)
+
+        assert 'Key' in response.__keylist__
+        assert customer.Name == 'Test'
+        assert customer.Key == []
+
     def test_get(self, queryset):
         customer = queryset.get(No='Test')
 
@@ -384,6 +557,12 @@ class TestNavQueryset:
         assert customers[0].Key[0].id == 'Key0'
         assert customers[0].Key[2].id == 'Key1'
 
+    def test_get_keeps_company_order(self, queryset):
+        customer = queryset.get(No='Test')
+
+        assert [key.company for key in customer.Key] == \
+            queryset.model.client.companies
+
     '''@pytest.mark.skip(reason="removed method")
     def test_get_raise_error_providing_false_kwargs(self, queryset):
         with pytest.raises(AttributeError):
@@ -447,6 +626,7 @@ class TestNavQueryset:
         customer = queryset.get(No='Test')
         response = queryset.delete()
 
+        assert isinstance(response, managers.WriteReport)
         assert response
 
     def test_delete_without_providing_key_with_wrong_queryset(self, queryset):
@@ -461,7 +641,42 @@ class TestNavQueryset:
         customer = queryset.get(No='Test')
         response = queryset.delete()
 
+        assert isinstance(response, managers.WriteReport)
         assert not response
+        assert response.get_failed_companies() == ['Company1']
+
+    def test_delete_with_queryset_keeps_failed_keys(self, queryset):
+        queryset.model._meta.delete = 'Delete_Diff'
+        queryset.get(No='Test')
+        queryset.delete()
+
+        assert len(queryset.queryset) == 1
+        assert [(k.company, k.id) for k in queryset.queryset[0].Key] == \
+            [('Company1', 'Key')]
+
+    def test_bulk_delete(self, queryset):
+        queryset.model._meta.delete = 'Delete_Diff'
+        queryset.get(No='Test')
+
+        assert queryset.bulk_delete() == set([('Company1', 'Key')])
+
+    def test_bulk_delete_providing_keys(self, queryset, fault_company):
+        keys = [managers.Instance('Company%s' % (i % 4 + 1), 'Key%s' % i)
+                for i in range(8)]
+
+        assert queryset.bulk_delete(keys) == \
+            set([('Company2', 'Key1'), ('Company2', 'Key5')])
+
+    def test_bulk_delete_bounded_workers(self, queryset, requests):
+        requests.delay = 0.01
+        keys = [managers.Instance('Company1', 'Key%s' % i) for i in range(10)]
+
+        assert queryset.bulk_delete(keys, max_workers=3) == set()
+        assert requests.max_concurrent <= 3
+
+    def test_bulk_delete_wrong_keys(self, queryset):
+        with pytest.raises(TypeError):
+            queryset.bulk_delete(['Key'])
 
     def test_delete_providing_obj(self, queryset):
         customer = queryset.get(No='Test')
@@ -476,6 +691,34 @@ class TestNavQueryset:
 
         assert not response
 
+    def test_delete_report(self, queryset):
+        queryset.model._meta.delete = 'Delete_Diff'
+        customer = queryset.get(No='Test')
+        report = queryset.delete(obj=customer)
+
+        assert isinstance(report, managers.WriteReport)
+        assert report.get_failed_companies() == ['Company1']
+        assert len(report.succeeded) == 3
+        assert report.failed[0].status == managers.CompanyResult.FAILED
+        assert report.failed[0].key == 'Key'
+
+    def test_delete_failed_at_all_companies_raises(self, queryset,
+                                                   fault_company):
+        from suds import WebFault
+        del fault_company[:]
+        customer = queryset.get(No='Test')
+        fault_company.extend(queryset.model.client.companies)
+
+        with pytest.raises(WebFault):
+            queryset.delete(obj=customer)
+        with pytest.raises(WebFault):
+            queryset.delete(Key=customer.Key)
+        with pytest.raises(WebFault):
+            customer.delete()
+        with pytest.raises(WebFault):
+            queryset.delete()
+        assert len(queryset.queryset) == 1
+
 ## Test create
 
     def test_create(self, queryset):
@@ -494,6 +737,33 @@ class TestNavQueryset:
         assert len(customer_obj.Key) == 2
         assert customer_obj.Key[0].id == 'Key'
 
+    def test_create_partial_failure(self, queryset, fault_company):
+        customer = queryset.create(No='Test', Name='Test')
+
+        assert len(customer.Key) == 3
+        assert 'Company2' not in customer.get_companies()
+        assert customer.report.get_failed_companies() == ['Company2']
+        assert customer.report.failed[0].fault is not None
+        for result in customer.report.succeeded:
+            assert result.key == 'Key'
+
+    def test_create_retry_failed_companies(self, queryset, customer_model,
+                                           fault_company):
+        customer = queryset.create(No='Test', Name='Test')
+        failed = customer.report.get_failed_companies()
+        fault_company.remove('Company2')
+        retried = queryset.create(companies=failed, No='Test', Name='Test')
+
+        assert retried.get_companies() == ['Company2']
+        assert retried.report
+
+    def test_create_failure(self, queryset, fault_company):
+        from suds import WebFault
+        fault_company.extend(queryset.model.client.companies)
+
+        with pytest.raises(WebFault):
+            queryset.create(No='Test', Name='Test')
+
 ## Test update
 
     def test_update(self, queryset):
@@ -503,6 +773,14 @@ class TestNavQueryset:
         assert len(customer.Key) == 4
         assert customer.Name == name
 
+    def test_update_skip_missing_companies(self, queryset, fault_company):
+        customer = queryset.update(Key='Test', Name='Test for example')
+
+        assert len(customer.Key) == 3
+        assert customer.report
+        statuses = dict((r.company, r.status) for r in customer.report)
+        assert statuses['Company2'] == managers.CompanyResult.SKIPPED
+
     def test_update_without_key(self, queryset):
         with pytest.raises(TypeError):
             queryset.update(Name='Test')
@@ -561,6 +839,142 @@ class TestNavQueryset:
         with pytest.raises(Exception):
             queryset.get_or_create(No='Test')
 
+## bulk
+
+    def test_bulk_create(self, queryset, customer_model, sent):
+        companies = queryset.model.client.companies
+        customers = [customer_model(No='C%s' % i, Name='Customer %s' % i)
+                     for i in range(5)]
+        queryset.bulk_create(customers, batch_size=2)
+
+        assert sent == ['CreateMultiple'] * 3 * len(companies)
+        for i, customer in enumerate(customers):
+            assert customer.Name == 'Customer %s' % i
+            assert customer.get_companies() == companies
+            assert [key.id for key in customer.Key] == \
+                ['%s-C%s' % (company, i) for company in companies]
+            assert customer.report
+            assert len(customer.report.succeeded) == len(companies)
+
+    def test_bulk_create_journal(self, queryset, monkeypatch):
+        sent = []
+
+        class JournalClient(object):
+            def get_service_params(self, method):
+                return [('CurrentJnlBatchName', None), ('Customer_List', None)]
+
+            def CreateMultiple(self, **params):
+                sent.append(params)
+
+        monkeypatch.setattr(queryset.model._meta, 'journal', 'BATCH')
+        records = [{'No': 'C1'}]
+        queryset._bulk_query(JournalClient(), 'CreateMultiple', records)
+
+        assert sent == [{'CurrentJnlBatchName': 'BATCH',
+                         'Customer_List': {'Customer': records}}]
+
+    def test_bulk_create_at_companies(self, queryset, customer_model):
+        customer = customer_model(No='C1', Name='Customer')
+        customer.add_companies(['Company3'])
+        queryset.bulk_create([customer], companies=['Company1'])
+
+        assert [(k.company, k.id) for k in customer.Key] == \
+            [('Company3', 'Company3-C1')]
+
+    def test_bulk_create_partial_failure(self, queryset, customer_model,
+                                         fault_company):
+        customers = [customer_model(No='C%s' % i, Name='Customer')
+                     for i in range(3)]
+        queryset.bulk_create(customers)
+
+        for customer in customers:
+            assert not customer.report
+            assert customer.report.get_failed_companies() == ['Company2']
+            assert 'Company2' not in [k.company for k in customer.Key if k.id]
+
+    def test_bulk_create_failure(self, queryset, customer_model,
+                                 fault_company):
+        from suds import WebFault
+        fault_company.extend(queryset.model.client.companies)
+        customers = [customer_model(No='C1', Name='Customer')]
+
+        with pytest.raises(WebFault):
+            queryset.bulk_create(customers)
+
+    def test_bulk_update(self, queryset, customer_model):
+        customer = customer_model(No='C1', Name='Changed')
+        customer.add_id('Company1', None, 'Key1')
+        customer.add_id('Company2', None, 'Key2')
+        queryset.bulk_update([customer])
+
+        assert [(k.company, k.id) for k in customer.Key] == \
+            [('Company1', 'Key1'), ('Company2', 'Key2')]
+        assert customer.Name == 'Changed'
+        assert len(customer.report.succeeded) == 2
+
+## in_bulk
+
+    def test_in_bulk(self, queryset, sent):
+        keys = [managers.Instance('Company1', 'Key1'),
+                managers.Instance('Company2', 'Key2'),
+                managers.Instance('Company1', 'Missing')]
+        customers = queryset.in_bulk(keys)
+
+        # Every key is read only at its company
+        assert sent.count('GetRecIdFromKey') == 3
+        assert sent.count('ReadByRecId') == 2
+
+        assert sorted(customers.keys()) == ['Key1', 'Key2']
+        assert customers['Key1'].No == 'TEST'
+        assert [(k.company, k.id) for k in customers['Key1'].Key] == \
+            [('Company1', 'Key1')]
+        assert [(k.company, k.id) for k in customers['Key2'].Key] == \
+            [('Company2', 'Key2')]
+
+    def test_in_bulk_key_strings(self, queryset, sent):
+        customers = queryset.in_bulk(['Key1', 'Missing'],
+                                     companies=['Company1', 'Company3'])
+
+        assert customers.keys() == ['Key1']
+        assert [k.company for k in customers['Key1'].Key] == \
+            ['Company1', 'Company3']
+        # The record id of a key is requested once for all the companies
+        assert sent.count('GetRecIdFromKey') == 2
+        assert sent.count('ReadByRecId') == 2
+
+    def test_in_bulk_base_queryset(self, sent):
+        class Meta:
+            default_id = 'No'
+            journal = None
+
+        customer_model = type('Customer', (models.Model, ),
+                              {'__module__': '__main__', 'Meta': Meta})
+        latherclient = client.LatherClient('test', cache=None)
+        latherclient.register(customer_model)
+        customers = customer_model.objects.in_bulk(['TEST', 'TEST2'])
+
+        assert sorted(customers.keys()) == ['TEST', 'TEST2']
+        assert sent == ['Read', 'Read']
+
+    def test_in_bulk_concurrent(self, queryset, requests):
+        keys = [managers.Instance('Company%s' % i, 'Key%s' % i)
+                for i in range(1, 5)]
+
+        assert len(queryset.in_bulk(keys)) == 4
+        assert len(requests.threads) > 1
+
+    def test_in_bulk_field_name(self, queryset, requests):
+        messages = requests.messages
+        customers = queryset.in_bulk(['TEST', 'TEST2'], field_name='No')
+
+        assert sorted(customers.keys()) == ['TEST', 'TEST2', 'TEST3']
+        assert len(messages) == len(queryset.model.client.companies)
+        assert 'Criteria>TEST|TEST2<' in messages[0]
+
+    def test_in_bulk_empty(self, queryset):
+        assert queryset.in_bulk([]) == {}
+        assert queryset.in_bulk([], field_name='No') == {}
+
 ## filter
 
     def test_filter(self, queryset):
@@ -571,6 +985,183 @@ class TestNavQueryset:
         assert response.queryset[1].Name == 'Test for example'
         assert response.queryset[2].Name == 'Test3 for example'
 
+    def test_filter_reuses_executor(self, queryset, requests, monkeypatch):
+        from multiprocessing.pool import ThreadPool
+        threads = requests.threads
+        pool = ThreadPool(2)
+        monkeypatch.setattr(queryset.model.client, '_executor', pool)
+        list(queryset.filter(No='TEST*'))
+        list(queryset.filter(Name='Test*'))
+
+        assert threads and threads <= set(pool._pool)
+        pool.close()
+
+    def test_filter_concurrent(self, queryset, requests):
+        requests.delay = 0.05
+        companies = queryset.model.client.companies
+        response = queryset.filter(No='Test*')
+
+        assert len(response.queryset) == 3
+        assert len(requests.threads) == len(companies)
+        for customer in response.queryset:
+            assert [key.company for key in customer.Key] == companies
+
+    def test_filter_serial(self, queryset):
+        queryset.model.client.max_workers = 1
+        response = queryset.filter(No='Test*')
+
+        assert len(response.queryset) == 3
+        assert [key.company for key in response.queryset[0].Key] == \
+            queryset.model.client.companies
+
+    def test_filter_pages(self, queryset, requests):
+        messages = requests.messages
+        queryset.model.client.max_workers = 1
+        queryset.model._meta.page_size = 2
+        response = queryset.filter(No='Test*')
+
+        assert [c.No for c in response.queryset] == ['TEST', 'TEST2', 'TEST3']
+        companies = len(queryset.model.client.companies)
+        assert len(messages) == 2 * companies
+        assert 'setSize>2<' in messages[0]
+        assert 'bookmarkKey' not in messages[0]
+        assert 'bookmarkKey>Key2<' in messages[1]
+
+    def test_filter_full_last_page(self, queryset):
+        queryset.model._meta.page_size = 3
+        response = queryset.filter(No='Test*')
+
+        assert len(response.queryset) == 3
+
+    def test_filter_is_lazy(self, queryset, requests):
+        messages = requests.messages
+        queryset.model.client.max_workers = 1
+        response = queryset.filter(No='Test*').exclude(Name='Test')
+
+        assert messages == []
+        assert len(response) == 3
+        assert bool(response)
+        assert response[0].No == 'TEST'
+        assert [c.No for c in response] == ['TEST', 'TEST2', 'TEST3']
+        assert len(messages) == len(queryset.model.client.companies)
+        assert 'Criteria>Test*<' in messages[0]
+        assert 'Criteria>&lt;&gt;Test<' in messages[0]
+
+    def test_filter_returns_new_queryset(self, queryset):
+        first = queryset.filter(No='Test*')
+        second = first.filter(Name='Test')
+
+        assert first is not queryset and second is not first
+        assert first._get_criteria() == [({'No': 'Test*'}, None)]
+        assert second._get_criteria() == \
+            [({'No': 'Test*', 'Name': 'Test'}, None)]
+        assert queryset._get_criteria() == [({}, None)]
+
+    def test_filter_merges_criteria_of_same_field(self, queryset):
+        response = queryset.filter(No='Test*').exclude(No='Test2') \
+            .filter(No='<>Test3')
+
+        assert response._get_criteria() == \
+            [({'No': 'Test*&<>Test2&<>Test3'}, None)]
+
+    def test_filter_empty_results(self, queryset, monkeypatch):
+        monkeypatch.setattr(managers.NavQuerySet, '_filter',
+                            lambda self, client, **kwargs: iter([]))
+        response = queryset.filter(No='Missing')
+
+        assert len(response) == 0
+        assert not response
+        assert list(response) == []
+
+    def test_filter_merges_equal_objects_of_companies(self, queryset,
+                                                      monkeypatch):
+        from suds.transport.http import HttpTransport
+        send = HttpTransport.send
+
+        def company_send(transport, request):
+            # The second customer differs at the Company2
+            reply = send(transport, request)
+            if request.url.startswith('Company2'):
+                reply.message = reply.message.replace('Test for example',
+                                                      'Changed')
+            return reply
+
+        monkeypatch.setattr(HttpTransport, 'send', company_send)
+        companies = queryset.model.client.companies
+        response = queryset.filter(No='Test*')
+
+        assert sorted([c.Name for c in response]) == \
+            ['Changed', 'Test', 'Test for example', 'Test3 for example']
+        for customer in response:
+            keys = [key.company for key in customer.Key]
+            if customer.Name == 'Changed':
+                assert keys == ['Company2']
+            elif customer.Name == 'Test for example':
+                assert keys == [c for c in companies if c != 'Company2']
+            else:
+                assert keys == companies
+
+    def test_filter_in(self, queryset, requests):
+        messages = requests.messages
+        queryset.model.client.max_workers = 1
+        queryset.model._meta.max_criteria_length = 10
+        response = queryset.filter(No__in=['TEST', 'TEST2', 'TEST3'])
+
+        assert [c.No for c in response] == ['TEST', 'TEST2', 'TEST3']
+        assert len(messages) == 2 * len(queryset.model.client.companies)
+        assert 'Criteria>TEST|TEST2<' in messages[0]
+        assert 'Criteria>TEST3<' in messages[1]
+
+    def test_filter_empty_in(self, queryset, monkeypatch):
+        from suds.transport.http import HttpTransport
+        queryset.model.client.companies
+        monkeypatch.setattr(HttpTransport, 'send', None)
+
+        assert list(queryset.filter(No__in=[])) == []
+
+    def test_filter_q(self, queryset, requests):
+        messages = requests.messages
+        queryset.model.client.max_workers = 1
+        response = queryset.filter(models.Q(No__gte='TEST2') |
+                                   models.Q(Name__startswith='Test'))
+
+        assert len(response) == 3
+        assert len(messages) == 2 * len(queryset.model.client.companies)
+        assert 'Criteria>&gt;=TEST2<' in messages[0]
+        assert 'Criteria>Test*<' in messages[1]
+
+    def test_filter_post_filter(self, queryset):
+        response = queryset.filter(No__startswith='TEST') \
+            .exclude(Name__contains='example')
+
+        assert [c.No for c in response] == ['TEST']
+
+    def test_iterator_post_filter(self, queryset):
+        customers = queryset.exclude(Name__endswith='example') \
+            .iterator(companies=['Company1'])
+
+        assert [c.No for c in customers] == ['TEST']
+
+## iterator
+
+    def test_iterator(self, queryset):
+        companies = queryset.model.client.companies
+        customers = list(queryset.iterator(chunk_size=2, No='Test*'))
+
+        assert len(customers) == 3 * len(companies)
+        assert [c.No for c in customers[:3]] == ['TEST', 'TEST2', 'TEST3']
+        assert [key.company for key in customers[0].Key] == companies[:1]
+
+    def test_iterator_is_lazy(self, queryset, requests):
+        messages = requests.messages
+        iterator = queryset.iterator(chunk_size=2, companies=['Company1'])
+
+        assert messages == []
+        assert next(iterator).No == 'TEST'
+        assert len(messages) == 1
+        assert [c.No for c in iterator] == ['TEST2', 'TEST3']
+        assert len(messages) == 2
+
 ## len
 
     def test_len(self, queryset):
@@ -603,6 +1194,180 @@ class TestNavQueryset:
         with pytest.raises(Exception):
             queryset.count()
 
+## custom endpoints
+
+    def test_custom_endpoints(self, queryset, sent, monkeypatch):
+        def make_model(method):
+            class Meta:
+                fields = 'all'
+                page = 'Page/Customer'
+                endpoints = (
+                    ('custom_read', {
+                        'method': method
+                    }),
+                )
+
+            nmspc = {'__module__': '__main__', 'Meta': Meta}
+            return type('Customer', (models.NavModel, ), nmspc)
+
+        monkeypatch.delattr(managers.BaseQuerySet, 'custom_read',
+                            raising=False)
+        read, read_diff = make_model('Read'), make_model('Read_Diff')
+        latherclient = queryset.model.client
+        latherclient.register(read)
+        latherclient.register(read_diff)
+        connect = latherclient.connect
+        pages = []
+
+        def counted_connect(page, *args, **kwargs):
+            pages.append(page)
+            return connect(page, *args, **kwargs)
+
+        monkeypatch.setattr(latherclient, 'connect', counted_connect)
+
+        assert read.objects.custom_read(No='Test').Name == 'Test'
+        assert read.objects.custom_read(No='Test').Name == 'Test'
+        assert read_diff.objects.custom_read(No='Test').Key == 'Key0'
+        assert sent == ['Read', 'Read', 'Read_Diff']
+        assert pages == ['Page/Customer'] * 2
+
+## connection
+
+    def test_queryset_connects_lazily(self, customer_model, monkeypatch):
+        latherclient = client.NavLatherClient('test', cache=None)
+        latherclient.companies
+        latherclient.register(customer_model)
+        connect = latherclient.connect
+        pages = []
+
+        def counted_connect(page, *args, **kwargs):
+            pages.append(page)
+            return connect(page, *args, **kwargs)
+
+        monkeypatch.setattr(latherclient, 'connect', counted_connect)
+        manager = managers.Manager(customer_model)
+        queryset = managers.QuerySet(manager, customer_model)
+
+        assert pages == []
+        assert queryset.client is manager.connection
+        assert managers.QuerySet(manager, customer_model).client is \
+            queryset.client
+        assert len(pages) == 1
+        latherclient.invalidate()
+        assert managers.QuerySet(manager, customer_model).client is not \
+            queryset.client
+        assert len(pages) == 2
+
+    def test_manager_caches_wrappers(self, queryset):
+        objects = queryset.model.objects
+
+        assert objects.filter is objects.filter
+        with pytest.raises(AttributeError):
+            objects.missing
+
+## batch
+
+    def test_batch_get(self, queryset, sent):
+        companies = queryset.model.client.companies
+        objects = queryset.model.objects
+        with objects.batch() as loader:
+            customers = [objects.get(No=no) for no in
+                         ('TEST', 'TEST2', 'TEST', 'MISSING')]
+            assert sent == []
+
+        assert sent.count('ReadMultiple') == len(companies)
+        assert 'Read' not in sent
+        assert [c.Name for c in customers[:3]] == ['Test', 'Test for example',
+                                                   'Test']
+        assert customers[0].result() is not customers[2].result()
+        assert customers[0].result() == customers[2].result()
+        assert customers[0].Key[0] is not customers[2].Key[0]
+        with pytest.raises(exceptions.ObjectDoesNotExist):
+            customers[3].result()
+        assert not loader._pending
+
+    def test_batch_get_set_attribute(self, queryset, sent):
+        objects = queryset.model.objects
+        with objects.batch():
+            customer = objects.get(No='TEST')
+            customer.Name = 'Changed'
+
+        assert customer.result().Name == 'Changed'
+        customer.save()
+        assert 'Update' in sent
+
+    def test_batch_get_different_objects(self, queryset, monkeypatch):
+        model = queryset.model
+        objects = [model(No='TEST', Name='Test'),
+                   model(No='TEST', Name='Other')]
+        monkeypatch.setattr(managers.NavQuerySet, 'filter',
+                            lambda self, **kwargs: objects)
+        with model.objects.batch():
+            result = model.objects.get(No='TEST')
+
+        # Like the get outside the batch
+        assert isinstance(result.result(), managers.NavQuerySet)
+        assert list(result.result()) == objects
+
+    def test_batch_get_flushed_by_result(self, queryset, sent):
+        objects = queryset.model.objects
+        with objects.batch():
+            first = objects.get(No='TEST')
+            second = objects.get(No='TEST2')
+            assert first.Name == 'Test'
+            assert second.done()
+            # Gets of many fields are executed one by one
+            third = objects.get(No='TEST', Name='Test')
+            assert third.Name == 'Test'
+            assert 'Read' in sent
+
+        assert isinstance(objects.get(No='TEST'), queryset.model)
+
+    def test_batch_get_window(self, queryset, sent):
+        import time
+        objects = queryset.model.objects
+        with objects.batch(window=0.01):
+            customer = objects.get(No='TEST')
+            time.sleep(0.5)
+            assert customer.done()
+            assert customer.Name == 'Test'
+
+## coalesced reads
+
+    def test_get_coalesces_concurrent_reads(self, queryset, requests, sent,
+                                            monkeypatch):
+        from multiprocessing.pool import ThreadPool
+        from lather.utils import map_concurrently
+        requests.delay = 0.1
+        # All the company reads of the callers run at the same time
+        monkeypatch.setattr(queryset.model.client, '_executor',
+                            ThreadPool(16))
+        companies = queryset.model.client.companies
+        customers = map_concurrently(
+            lambda i: queryset.model.objects.get(No='Test'), range(4),
+            max_workers=4)
+
+        assert [c.Name for c in customers] == ['Test'] * 4
+        assert sent.count('Read') == len(companies)
+        queryset.model.objects.get(No='Test')
+        assert sent.count('Read') == 2 * len(companies)
+
+    def test_filter_coalesces_concurrent_reads(self, queryset, requests, sent,
+                                               monkeypatch):
+        from multiprocessing.pool import ThreadPool
+        from lather.utils import map_concurrently
+        requests.delay = 0.1
+        # All the company reads of the callers run at the same time
+        monkeypatch.setattr(queryset.model.client, '_executor',
+                            ThreadPool(16))
+        companies = queryset.model.client.companies
+        results = map_concurrently(
+            lambda i: len(queryset.model.objects.filter(No='TEST*')),
+            range(4), max_workers=4)
+
+        assert results == [results[0]] * 4
+        assert sent.count('ReadMultiple') == len(companies)
+
 
 class TestField:
 
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+from lather import query
+
+
+class TestQuote:
+
+    def test_quote_plain_value(self):
+        assert query.quote('TEST') == 'TEST'
+
+    def test_quote_special_characters(self):
+        assert query.quote('A&B') == "'A&B'"
+        assert query.quote("O'Brien") == "'O''Brien'"
+
+    def test_quote_empty_value(self):
+        assert query.quote('') == "''"
+
+    def test_quote_number(self):
+        assert query.quote(10) == '10'
+
+
+class TestQ:
+
+    def test_to_dnf(self):
+        q = query.Q(No='A') & (query.Q(Name='B') | query.Q(Name='C'))
+
+        assert q.to_dnf() == [[('No', 'A', False), ('Name', 'B', False)],
+                              [('No', 'A', False), ('Name', 'C', False)]]
+
+    def test_to_dnf_negated(self):
+        q = ~query.Q(No='A', Name='B')
+
+        assert q.to_dnf() == [[('Name', 'B', True)], [('No', 'A', True)]]
+
+    def test_to_dnf_double_negation(self):
+        q = ~(~query.Q(No='A') | query.Q(Name='B'))
+
+        assert q.to_dnf() == [[('No', 'A', False), ('Name', 'B', True)]]
+
+    def test_to_dnf_empty(self):
+        assert query.Q().to_dnf() == [[]]
+
+
+class TestCompileFilters:
+
+    def compile(self, q, max_length=None):
+        results = query.compile_filters(q, max_length)
+        assert [p for c, p in results] == [None] * len(results)
+        return [c for c, p in results]
+
+    def test_exact(self):
+        assert self.compile(query.Q(No='Test*')) == [{'No': 'Test*'}]
+
+    def test_exact_negated(self):
+        assert self.compile(~query.Q(No='Test*')) == [{'No': '<>Test*'}]
+
+    def test_in(self):
+        q = query.Q(No__in=['A', 'B|C', 'D'])
+
+        assert self.compile(q) == [{'No': "A|'B|C'|D"}]
+
+    def test_in_split_by_max_length(self):
+        q = query.Q(No__in=['AAA', 'BBB', 'CCC', 'DDD', 'EEE'])
+
+        assert self.compile(q, max_length=8) == \
+            [{'No': 'AAA|BBB'}, {'No': 'CCC|DDD'}, {'No': 'EEE'}]
+
+    def test_in_with_other_filters(self):
+        q = query.Q(Name='Test*', No__in=['AAA', 'BBB', 'CCC'])
+
+        assert self.compile(q, max_length=8) == [
+            {'Name': 'Test*', 'No': 'AAA|BBB'},
+            {'Name': 'Test*', 'No': 'CCC'}]
+
+    def test_in_with_same_field(self):
+        q = query.Q(No='A*') & query.Q(No__in=['A1', 'A2'])
+
+        assert self.compile(q) == [{'No': 'A*&(A1|A2)'}]
+
+    def test_empty_in(self):
+        assert self.compile(query.Q(No__in=[])) == []
+
+    def test_exclude_in(self):
+        assert self.compile(~query.Q(No__in=['A', 'B'])) == \
+            [{'No': '<>A&<>B'}]
+
+    def test_exclude_empty_in(self):
+        assert self.compile(~query.Q(No__in=[])) == [{}]
+
+    def test_without_filters(self):
+        assert self.compile(query.Q()) == [{}]
+
+    def test_comparisons(self):
+        q = query.Q(Balance__gt=10, Credit__gte=5, Due__lt='2020-01-01',
+                    Limit__lte=100, No__ne='A&B')
+
+        assert self.compile(q) == [{
+            'Balance': '>10', 'Credit': '>=5', 'Due': '<2020-01-01',
+            'Limit': '<=100', 'No': "<>'A&B'"}]
+
+    def test_comparisons_negated(self):
+        q = ~query.Q(Balance__gt=10)
+
+        assert self.compile(q) == [{'Balance': '<=10'}]
+        assert self.compile(~query.Q(No__ne='A')) == [{'No': 'A'}]
+
+    def test_range(self):
+        assert self.compile(query.Q(No__range=('A', 'C'))) == \
+            [{'No': 'A..C'}]
+        assert self.compile(~query.Q(No__range=('A', 'C'))) == \
+            [{'No': '<A|>C'}]
+
+    def test_wildcards(self):
+        q = query.Q(No__startswith='A', Name__contains='B',
+                    City__endswith='C')
+
+        assert self.compile(q) == [{'No': 'A*', 'Name': '*B*', 'City': '*C'}]
+
+    def test_or_on_different_fields(self):
+        q = query.Q(No='A') | query.Q(Name='B')
+
+        assert self.compile(q) == [{'No': 'A'}, {'Name': 'B'}]
+
+    def test_unknown_lookup_is_field_name(self):
+        assert self.compile(query.Q(No__other='A')) == [{'No__other': 'A'}]
+
+
+class TestPostFilter:
+
+    class Record(object):
+        def __init__(self, **kwargs):
+            self.__dict__.update(kwargs)
+
+    def test_startswith_with_special_characters(self):
+        results = query.compile_filters(query.Q(No__startswith='A&'))
+        criteria, predicate = results[0]
+
+        assert criteria == {}
+        assert predicate(self.Record(No='A&B'))
+        assert not predicate(self.Record(No='AB'))
+        assert not predicate(self.Record(No=None))
+
+    def test_negated_wildcard(self):
+        results = query.compile_filters(
+            query.Q(Name='Test*') & ~query.Q(No__contains='2'))
+        criteria, predicate = results[0]
+
+        assert criteria == {'Name': 'Test*'}
+        assert predicate(self.Record(No='TEST'))
+        assert not predicate(self.Record(No='TEST2'))
+
+    def test_long_negated_in(self):
+        results = query.compile_filters(
+            ~query.Q(No__in=['AAA', 'BBB', 'CCC']), max_length=8)
+        criteria, predicate = results[0]
+
+        assert criteria == {}
+        assert predicate(self.Record(No='DDD'))
+        assert not predicate(self.Record(No='BBB'))
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+import time
+
+import pytest
+
+from lather.utils import SingleFlight, map_concurrently
+
+
+class TestSingleFlight:
+
+    def test_concurrent_calls_share_the_result(self):
+        single_flight = SingleFlight()
+        calls = []
+
+        def func():
+            calls.append(1)
+            time.sleep(0.05)
+            return 'value'
+
+        results = map_concurrently(lambda i: single_flight.do('key', func),
+                                   range(5), max_workers=5)
+
+        assert results == ['value'] * 5
+        assert len(calls) == 1
+
+    def test_sequential_calls_are_not_cached(self):
+        single_flight = SingleFlight()
+        calls = []
+
+        def func():
+            calls.append(1)
+            return len(calls)
+
+        assert single_flight.do('key', func) == 1
+        assert single_flight.do('key', func) == 2
+
+    def test_exception_raised_to_all_callers(self):
+        single_flight = SingleFlight()
+
+        def func():
+            time.sleep(0.05)
+            raise ValueError('Failed')
+
+        def call(i):
+            try:
+                single_flight.do('key', func)
+            except ValueError, e:
+                return str(e)
+
+        results = map_concurrently(call, range(3), max_workers=3)
+
+        assert results == ['Failed'] * 3
+        with pytest.raises(ValueError):
+            single_flight.do('key', func)
+
+
+class TestMapConcurrently:
+
+    def test_results_in_order(self):
+        results = map_concurrently(lambda i: i * 2, range(10), max_workers=4)
+
+        assert results == [i * 2 for i in range(10)]
+
+    def test_executor_nested_calls(self):
+        from multiprocessing.pool import ThreadPool
+        pool = ThreadPool(2)
+
+        def call(i):
+            # Runs serially at the thread of the pool instead of waiting for
+            # the threads which wait for it
+            return map_concurrently(lambda j: i * j, range(3), 2, pool)
+
+        results = map_concurrently(call, range(4), 2, pool)
+
+        assert results == [[i * j for j in range(3)] for i in range(4)]
+        pool.close()
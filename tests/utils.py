@@ -1,4 +1,7 @@
 # -*- coding: utf-8 -*-
+import time
+import threading
+
 from lather import exceptions
 
 
@@ -24,3 +27,35 @@ class MaxLengthValidaiton(object):
         if len(value) > self.limit_value:
             raise exceptions.ValidationError('Max length reached')
 
+
+
+class SentRequests(object):
+    """
+    Records the requests of the transport: the SOAP actions, the messages,
+    the threads which sent them and the max number of concurrent requests.
+    The requests are sent after the delay (seconds)
+    """
+    def __init__(self):
+        self.actions = []
+        self.messages = []
+        self.threads = set()
+        self.max_concurrent = 0
+        self.delay = 0
+        self._running = 0
+        self._lock = threading.Lock()
+
+    def send(self, send, transport, request):
+        with self._lock:
+            self.actions.append(request.headers['SOAPAction'].split(':')[-1]
+                                .strip('"'))
+            self.messages.append(request.message)
+            self.threads.add(threading.current_thread())
+            self._running += 1
+            self.max_concurrent = max(self.max_concurrent, self._running)
+        try:
+            if self.delay:
+                time.sleep(self.delay)
+            return send(transport, request)
+        finally:
+            with self._lock:
+                self._running -= 1